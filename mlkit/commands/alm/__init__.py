@@ -1,7 +1,9 @@
 import typer
-from . import prepare, scph_bands
+from . import cutoff, dfset, prepare, scph_bands
 
 app = typer.Typer(help="ALAMODE 相关工具")
 
 app.add_typer(prepare.app, name="prepare")
+app.command(name="dfset")(dfset.main)
+app.command(name="cutoff")(cutoff.main)
 app.command(name="plot-scph-bands")(scph_bands.main)
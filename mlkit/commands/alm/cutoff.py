@@ -0,0 +1,110 @@
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import typer
+
+# 距离相差小于该值 (Å) 的近邻视为同一壳层
+SHELL_TOL = 1e-3
+
+
+def _shells(distances: np.ndarray) -> np.ndarray:
+    """把距离聚成壳层，返回升序的壳层半径"""
+    d = np.sort(distances)
+    if not len(d):
+        return d
+    starts = np.concatenate(([True], np.diff(d) > SHELL_TOL))
+    return d[starts]
+
+
+def count_clusters(
+    vectors: np.ndarray, distances: np.ndarray, radii: np.ndarray
+) -> np.ndarray:
+    """
+    以某个原子为中心、其近邻矢量为 vectors 时，每个候选截断半径下的三体团簇数。
+    一个团簇 (中心, j, k) 需要的截断半径是三条边中最长的一条，
+    因此对所有近邻对算一次最长边，再用 searchsorted 对所有半径同时计数。
+    """
+    a, b = np.triu_indices(len(distances), 1)
+    longest = np.maximum(np.maximum(distances[a], distances[b]), np.linalg.norm(vectors[a] - vectors[b], axis=1))
+    longest.sort()
+    return np.searchsorted(longest, radii + SHELL_TOL, side="right")
+
+
+def main(
+    sposcar: Path = typer.Option(Path("SPOSCAR"), "--sposcar", help="alm prepare 生成的超胞"),
+    rmax: Optional[float] = typer.Option(None, "--rmax", help="最大搜索半径 (Å)，缺省为超胞内切球半径"),
+    nshells: int = typer.Option(6, "--shells", help="每个元素对列出的壳层数"),
+    max_clusters: Optional[int] = typer.Option(None, "--max-clusters", help="三体团簇数预算，给出时推荐不超预算的最大截断"),
+):
+    """
+    基于近邻表分析超胞，按元素对列出近邻壳层，并统计每个候选三阶截断半径
+    产生的二体/三体团簇数，用于选择 ALM &cutoff。
+    """
+    from ase.neighborlist import neighbor_list
+    from pymatgen.io.ase import AseAtomsAdaptor
+    from pymatgen.core import Structure
+    from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+    from .supercell import inscribed_radius
+
+    if not sposcar.is_file():
+        typer.echo(f"错误: 找不到文件 {sposcar}", err=True)
+        raise typer.Exit(1)
+
+    structure = Structure.from_file(sposcar)
+    inscribed = float(inscribed_radius(structure.lattice.matrix))
+    if rmax is None:
+        rmax = inscribed
+    elif rmax > inscribed + SHELL_TOL:
+        typer.echo(f"警告: --rmax {rmax:.3f} Å 超过超胞内切球半径 {inscribed:.3f} Å，团簇会与自身镜像重叠", err=True)
+
+    atoms = AseAtomsAdaptor.get_atoms(structure)
+    # 胞列表法的近邻搜索，包含周期镜像
+    i, j, d, vec = neighbor_list("ijdD", atoms, rmax + SHELL_TOL)
+    symbols = np.array(atoms.get_chemical_symbols())
+    # 每组对称等价原子只取一个作为团簇中心
+    orbits = SpacegroupAnalyzer(structure).get_symmetrized_structure().equivalent_indices
+    anchors = [orbit[0] for orbit in orbits]
+
+    radii = _shells(d)
+    clusters = np.zeros(len(radii), dtype=np.int64)
+    pairs_by_radius = np.zeros(len(radii), dtype=np.int64)
+    pair_dists: Dict[str, List[np.ndarray]] = {}
+    for anchor in anchors:
+        mask = i == anchor
+        nbr, dist = j[mask], d[mask]
+        clusters += count_clusters(vec[mask], dist, radii)
+        pairs_by_radius += np.searchsorted(np.sort(dist), radii + SHELL_TOL, side="right")
+        for element in np.unique(symbols[nbr]):
+            key = "-".join(sorted((str(symbols[anchor]), str(element))))
+            pair_dists.setdefault(key, []).append(dist[symbols[nbr] == element])
+
+    typer.echo(f"超胞: {len(structure)} 原子, 内切球半径 {inscribed:.3f} Å, 不等价中心原子 {len(anchors)} 个")
+    typer.echo("")
+    typer.echo("元素对近邻壳层 (半径 Å: 各不等价中心的近邻数之和)")
+    for key in sorted(pair_dists):
+        dist = np.sort(np.concatenate(pair_dists[key]))
+        shells = _shells(dist)[:nshells]
+        counts = np.diff(np.searchsorted(dist, shells + SHELL_TOL, side="right"), prepend=0)
+        typer.echo(f"  {key:<8} " + "  ".join(f"{r:.3f}:{n}" for r, n in zip(shells, counts)))
+
+    typer.echo("")
+    typer.echo(f"{'截断 (Å)':>10} {'二体':>8} {'三体团簇':>10}")
+    # 截断取相邻壳层中点，对壳层位置的微小数值误差不敏感
+    cutoffs = (radii + np.append(radii[1:], rmax)) / 2
+    for cutoff, npair, ncluster in zip(cutoffs, pairs_by_radius, clusters):
+        typer.echo(f"{cutoff:>10.3f} {npair:>8d} {ncluster:>10d}")
+
+    if max_clusters is not None:
+        within = np.nonzero(clusters <= max_clusters)[0]
+        if not len(within):
+            typer.echo(f"错误: 最近邻壳层已产生 {clusters[0]} 个三体团簇，超过预算 {max_clusters}", err=True)
+            raise typer.Exit(1)
+        best = within[-1]
+        # ALM 的 &cutoff 半径单位为 Bohr；prepare 写出 NORDER = 3，四阶沿用同一半径作为上限
+        from .prepare import BOHR
+
+        radius = cutoffs[best] / BOHR
+        typer.echo("")
+        typer.echo(f"推荐: --cutoff \"*-* None {radius:.2f} {radius:.2f}\"  ({cutoffs[best]:.3f} Å, {clusters[best]} 个三体团簇)")
@@ -0,0 +1,117 @@
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import typer
+from mlkit.core.outcar import read_outcar_trajectory
+from mlkit.core.parallel import imap_chunks
+from mlkit.core.vasprun import read_trajectory
+
+from .displace import DIRLIST_NAME
+from .prepare import BOHR, format_rows
+
+RYDBERG = 13.605693009
+FORCE_TO_RY_BOHR = BOHR / RYDBERG
+ROW_FMT = "%20.14f %20.14f %20.14f %20.8E %15.8E %15.8E\n"
+# 读取单个计算可能出现的错误：文件缺失/损坏、XML 截断 (ParseError)、没有离子步 (IndexError)
+READ_ERRORS = (OSError, EOFError, ValueError, IndexError, ET.ParseError)
+
+
+def _read_single_point(directory: Path) -> Tuple[Path, np.ndarray, np.ndarray, float]:
+    """读取目录中计算的最后一个离子步，失败时抛出带目录名的 ValueError"""
+    try:
+        return _read_last_step(directory)
+    except READ_ERRORS as e:
+        raise ValueError(f"{directory}: {e}") from e
+
+
+def _read_last_step(directory: Path) -> Tuple[Path, np.ndarray, np.ndarray, float]:
+    """优先 vasprun.xml(.gz)，其次 OUTCAR"""
+    for name in ("vasprun.xml", "vasprun.xml.gz"):
+        path = directory / name
+        if path.is_file():
+            frames = read_trajectory(path)
+            if frames["truncated"]:
+                raise ValueError(f"{path} 不完整，计算可能尚未结束")
+            break
+    else:
+        path = directory / "OUTCAR"
+        if not path.is_file():
+            raise FileNotFoundError(f"{directory} 中没有 vasprun.xml 或 OUTCAR")
+        frames = read_outcar_trajectory(path)
+        if not len(frames["energies"]):
+            raise ValueError(f"{path} 中没有完成的离子步")
+    return path, frames["positions"][-1], frames["forces"][-1], float(frames["energies"][-1])
+
+
+def _snapshot_block(
+    directory: Path,
+    snapshot: int,
+    ref_frac: np.ndarray,
+    lattice: np.ndarray,
+    ref_forces: Optional[np.ndarray],
+    ref_energy: float,
+) -> str:
+    """一个位移快照的 DFSET 文本块：位移 (Bohr) 和受力 (Ry/Bohr)"""
+    path, positions, forces, energy = _read_single_point(directory)
+    if len(positions) != len(ref_frac):
+        raise ValueError(f"{path} 的原子数 {len(positions)} 与参考超胞 {len(ref_frac)} 不一致")
+    frac = positions @ np.linalg.inv(lattice) - ref_frac
+    frac -= np.round(frac)
+    if ref_forces is not None:
+        forces = forces - ref_forces
+    rows = np.hstack((frac @ lattice / BOHR, forces * FORCE_TO_RY_BOHR))
+    header = "# Filename: %s, Snapshot: %d, E_pot (eV): %.8f\n" % (path, snapshot, energy - ref_energy)
+    return header + format_rows(ROW_FMT, rows)
+
+
+def _snapshot_chunk(tasks: List[Tuple[Path, int]], *args) -> List[str]:
+    return [_snapshot_block(directory, snapshot, *args) for directory, snapshot in tasks]
+
+
+def main(
+    dirs: Optional[List[Path]] = typer.Argument(None, help="位移计算目录（按模式顺序），缺省读取 --list"),
+    dir_list: Path = typer.Option(Path(DIRLIST_NAME), "--list", help="每行一个位移目录的清单 (alm prepare run 生成)"),
+    sposcar: Path = typer.Option(Path("SPOSCAR"), "--sposcar", help="无位移的参考超胞"),
+    offset: Optional[Path] = typer.Option(None, "--offset", help="参考超胞的计算目录，各快照减去其受力与能量"),
+    output: Path = typer.Option(Path("DFSET"), "-o", "--output", help="输出 DFSET 文件"),
+    jobs: int = typer.Option(1, "-j", "--jobs", min=1, help="并行解析的进程数"),
+    chunksize: int = typer.Option(8, "--chunksize", min=1, help="每个进程任务包含的目录数"),
+):
+    """
+    从各位移目录的 vasprun.xml / OUTCAR 组装 ALM optimize 模式所需的 DFSET。
+    """
+    from pymatgen.core import Structure
+
+    if not dirs:
+        if not dir_list.is_file():
+            typer.echo(f"错误: 未给出位移目录，且找不到清单 {dir_list}", err=True)
+            raise typer.Exit(1)
+        dirs = [Path(line.strip()) for line in dir_list.read_text().splitlines() if line.strip()]
+    if not sposcar.is_file():
+        typer.echo(f"错误: 找不到参考超胞 {sposcar}", err=True)
+        raise typer.Exit(1)
+
+    reference = Structure.from_file(sposcar)
+    ref_forces, ref_energy = None, 0.0
+    if offset is not None:
+        try:
+            _, _, ref_forces, ref_energy = _read_single_point(offset)
+        except ValueError as e:
+            typer.echo(f"错误: 参考计算读取失败: {e}", err=True)
+            raise typer.Exit(1)
+
+    args = (reference.frac_coords, reference.lattice.matrix, ref_forces, ref_energy)
+    tasks = [(directory, snapshot) for snapshot, directory in enumerate(dirs, start=1)]
+    written = 0
+    try:
+        with output.open("w") as f:
+            for _, block in imap_chunks(_snapshot_chunk, tasks, jobs, chunksize, *args):
+                f.write(block)
+                written += 1
+    except (OSError, ValueError) as e:
+        typer.echo(f"错误: {e}（已写出 {written} 个快照）", err=True)
+        raise typer.Exit(1)
+
+    typer.echo(f"已写出 {output}: {written} 个快照")
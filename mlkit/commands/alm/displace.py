@@ -0,0 +1,110 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+MANIFEST_NAME = "displacements.json"
+# 每行一个目录，作业数组中第 i 个任务读取第 i 行即可
+DIRLIST_NAME = "displacements.txt"
+
+# 一个位移模式: [(原子编号 0 起, 方向矢量)]
+Pattern = List[Tuple[int, np.ndarray]]
+
+
+def pattern_files(prefix: str, cwd: Path = Path(".")) -> List[Path]:
+    """ALM suggest 输出的模式文件，按阶数排序 (HARMONIC, ANHARM3, ANHARM4, ...)"""
+
+    def order(path: Path) -> int:
+        match = re.search(r"ANHARM(\d+)$", path.name)
+        return int(match.group(1)) if match else 2
+
+    return sorted(cwd.glob(f"{prefix}.pattern_*"), key=order)
+
+
+def read_patterns(path: Path) -> Tuple[str, List[Pattern]]:
+    """
+    读取 ALM 的 pattern 文件，返回 (基底 C/F, 位移模式列表)。格式为
+    "Basis : C" 一行，随后每个模式一行 "编号: 原子数"，再逐原子 "原子编号 dx dy dz"。
+    """
+    tokens = path.read_text().split()
+    if len(tokens) < 3 or tokens[0] != "Basis":
+        raise ValueError(f"{path} 不是 ALM 位移模式文件")
+    basis = tokens[2]
+
+    patterns: List[Pattern] = []
+    pos = 3
+    while pos < len(tokens):
+        natoms = int(tokens[pos + 1])
+        rows = np.array(tokens[pos + 2 : pos + 2 + natoms * 4], dtype=float).reshape(natoms, 4)
+        patterns.append([(int(row[0]) - 1, row[1:]) for row in rows])
+        pos += 2 + natoms * 4
+    return basis, patterns
+
+
+def displacement_vectors(pattern: Pattern, basis: str, lattice: np.ndarray, disp: float) -> Dict[int, np.ndarray]:
+    """
+    把模式方向换成笛卡尔坐标并归一化到 disp (Å)。同一原子出现多次时位移叠加
+    （如三阶对角项的 2 * disp），与 ALM 自带的 displace.py 一致。
+    """
+    vectors: Dict[int, np.ndarray] = {}
+    for atom, direction in pattern:
+        cart = direction @ lattice if basis.upper().startswith("F") else direction
+        vectors[atom] = vectors.get(atom, 0) + cart / np.linalg.norm(cart) * disp
+    return vectors
+
+
+def write_displaced(
+    out_dir: Path,
+    prefix: str,
+    lattice: np.ndarray,
+    cart_coords: np.ndarray,
+    poscar_text: Callable[[np.ndarray], str],
+    disp: float,
+    jobs: int = 8,
+) -> List[Dict[str, Any]]:
+    """
+    为每个位移模式生成一个目录并写出位移后的 POSCAR，目录按模式文件和编号命名
+    (harm-001, anharm3-001, ...)。所有模式先全部解析，写文件在线程池中并行完成。
+    同时写出 displacements.json (每个目录对应的模式与位移) 和 displacements.txt。
+    """
+    files = pattern_files(prefix)
+    if not files:
+        raise FileNotFoundError(f"找不到 {prefix}.pattern_* 文件")
+
+    inv = np.linalg.inv(lattice)
+    entries: List[Dict[str, Any]] = []
+    tasks: List[Tuple[Path, np.ndarray]] = []
+    for path in files:
+        basis, patterns = read_patterns(path)
+        tag = path.name.split(".pattern_")[-1].lower().replace("harmonic", "harm")
+        width = max(3, len(str(len(patterns))))
+        for index, pattern in enumerate(patterns, start=1):
+            vectors = displacement_vectors(pattern, basis, lattice, disp)
+            coords = cart_coords.copy()
+            for atom, vector in vectors.items():
+                coords[atom] += vector
+            disp_dir = out_dir / f"{tag}-{index:0{width}d}"
+            tasks.append((disp_dir, coords @ inv))
+            entries.append(
+                {
+                    "dir": str(disp_dir),
+                    "pattern_file": path.name,
+                    "index": index,
+                    "displacements": {str(atom + 1): vector.tolist() for atom, vector in vectors.items()},
+                }
+            )
+
+    def write(task: Tuple[Path, np.ndarray]) -> None:
+        disp_dir, frac_coords = task
+        disp_dir.mkdir(parents=True, exist_ok=True)
+        (disp_dir / "POSCAR").write_text(poscar_text(frac_coords))
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        list(pool.map(write, tasks))
+
+    (out_dir / MANIFEST_NAME).write_text(json.dumps({"disp": disp, "patterns": entries}, indent=2))
+    (out_dir / DIRLIST_NAME).write_text("".join(f"{entry['dir']}\n" for entry in entries))
+    return entries
@@ -1,8 +1,10 @@
+import shutil
+import subprocess
+
 import typer
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 import numpy as np
-import collections
 
 # pymatgen is now a direct dependency, but we still respect the structure.
 # Global imports for types are fine if strict lazy loading isn't enforced for direct deps,
@@ -16,45 +18,52 @@ import collections
 from pymatgen.core import Structure
 from pymatgen.core.periodic_table import get_el_sp
 
+from mlkit.core.shell import run_cmd
+
 app = typer.Typer(help="准备 ALM 计算所需文件")
 
 BOHR = 0.52917721067
 
 
+def _species_order(structure: Structure):
+    """
+    按首次出现顺序返回元素原子序数、各元素原子数和每个原子的元素编号 (从 1 开始)。
+    """
+    numbers = np.asarray(structure.atomic_numbers)
+    uniq, first, inverse, counts = np.unique(
+        numbers, return_index=True, return_inverse=True, return_counts=True
+    )
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return uniq[order].tolist(), counts[order].tolist(), rank[inverse.ravel()] + 1
+
+
+def format_rows(fmt: str, rows: np.ndarray) -> str:
+    """整块格式化: 一次 % 运算生成所有行，代替逐元素 f.write"""
+    return (fmt * len(rows)) % tuple(rows.ravel().tolist())
+
+
+def _lattice_block(structure: Structure) -> str:
+    return format_rows("%20.13f%20.13f%20.13f\n", structure.lattice.matrix)
+
+
+def _poscar_text(structure: Structure, frac_coords: np.ndarray) -> str:
+    numbers_uniq, num_species, _ = _species_order(structure)
+    return (
+        "%s\n" % structure.formula
+        + "1.000\n"
+        + _lattice_block(structure)
+        + "".join("%s " % get_el_sp(num) for num in numbers_uniq) + "\n"
+        + "".join("%i " % n for n in num_species) + "\n"
+        + "Direct\n"
+        + format_rows("%20.14f %20.14f %20.14f\n", frac_coords)
+    )
+
+
 def gen_supercell_poscar(structure: Structure):
     with open("SPOSCAR", "w") as f:
-        f.write("%s\n" % structure.formula)
-        f.write("1.000\n")
-        for i in range(3):
-            for j in range(3):
-                f.write("%20.13f" % structure.lattice.matrix[i][j])
-            f.write("\n")
-        atomic_numbers_uniq = list(
-            collections.OrderedDict.fromkeys(structure.atomic_numbers)
-        )
-        num_species = []
-        for num in atomic_numbers_uniq:
-            f.write("%s " % get_el_sp(num))
-            nspec = len(np.where(np.array(structure.atomic_numbers) == num)[0])
-            num_species.append(nspec)
-        f.write("\n")
-        for elem in num_species:
-            f.write("%i " % elem)
-        f.write("\n")
-        f.write("Direct\n")
-        for i in range(len(structure.frac_coords)):
-            f.write("%20.14f " % structure.frac_coords[i][0])
-            f.write("%20.14f " % structure.frac_coords[i][1])
-            f.write("%20.14f\n" % structure.frac_coords[i][2])
-
-
-def gen_species_dictionary2(atomic_number_uniq):
-    species_dict = {}
-    counter = 1
-    for num in atomic_number_uniq:
-        species_dict[num] = counter
-        counter += 1
-    return species_dict
+        f.write(_poscar_text(structure, structure.frac_coords))
 
 
 def gen_alm_input(
@@ -70,11 +79,7 @@ def gen_alm_input(
         typer.echo(f"Invalid MODE: {mode}", err=True)
         raise typer.Exit(1)
 
-    atomic_numbers_uniq = list(
-        collections.OrderedDict.fromkeys(structure.atomic_numbers)
-    )
-
-    species_index = gen_species_dictionary2(atomic_numbers_uniq)
+    atomic_numbers_uniq, _, kinds = _species_order(structure)
 
     with open(filename, "w") as f:
         f.write("&general\n")
@@ -84,7 +89,7 @@ def gen_alm_input(
         str_spec = ""
         for num in atomic_numbers_uniq:
             str_spec += str(get_el_sp(num)) + " "
-        f.write(" NKD = %i; KD = %s\n" % (structure.ntypesp, str_spec))
+        f.write(" NKD = %i; KD = %s\n" % (len(atomic_numbers_uniq), str_spec))
         f.write(" TOLERANCE = 1.0e-3\n")
         f.write("/\n\n")
         f.write("&interaction\n")
@@ -95,17 +100,11 @@ def gen_alm_input(
         f.write("/\n\n")
         f.write("&cell\n")
         f.write("%20.14f\n" % (1.0 / BOHR))
-        for i in range(3):
-            for j in range(3):
-                f.write("%20.13f" % structure.lattice.matrix[i][j])
-            f.write("\n")
+        f.write(_lattice_block(structure))
         f.write("/\n\n")
         f.write("&position\n")
-        for i in range(len(structure.frac_coords)):
-            f.write("%4i " % species_index[structure.atomic_numbers[i]])
-            f.write("%20.14f " % structure.frac_coords[i][0])
-            f.write("%20.14f " % structure.frac_coords[i][1])
-            f.write("%20.14f\n" % structure.frac_coords[i][2])
+        positions = np.column_stack((kinds, structure.frac_coords))
+        f.write(format_rows("%4i %20.14f %20.14f %20.14f\n", positions))
         f.write("/\n\n")
 
         if mode == "optimize":
@@ -121,9 +120,16 @@ def main(
     dim: List[int] = typer.Option([1, 1, 1], help="超胞尺寸 (x y z)"),
     disp: float = typer.Option(0.01, help="位移大小 (Angstrom)"),
     cutoff: str = typer.Option("*-* None 8 8", help="截断半径设置"),
+    min_radius: Optional[float] = typer.Option(None, "--min-radius", help="超胞内切球半径下限 (Å)，给出时搜索非对角超胞代替 --dim"),
+    max_atoms: Optional[int] = typer.Option(None, "--max-atoms", help="超胞原子数上限，给出时搜索该预算内内切球半径最大的非对角超胞"),
+    displace: bool = typer.Option(False, "--displace/--no-displace", help="运行 ALM suggest 并生成位移后的 POSCAR (需要 ALM 可执行文件)"),
+    alm: str = typer.Option("alm", "--alm", help="ALM 可执行文件"),
+    out_dir: Path = typer.Option(Path("."), "--out-dir", help="位移目录的父目录"),
+    jobs: int = typer.Option(8, "--jobs", "-j", help="并行写出位移目录的线程数"),
 ):
     """
     生成 ALM 建议位移 (suggest mode) 所需的文件 (SPOSCAR, ALM0.in)。
+    加 --displace 时再运行 ALM suggest，按每个位移模式生成一个含位移 POSCAR 的目录。
     """
     if not poscar.exists():
         typer.echo(f"错误: 找不到文件 {poscar}", err=True)
@@ -140,7 +146,25 @@ def main(
         typer.echo("错误: --dim 必须是 1 个或 3 个整数", err=True)
         raise typer.Exit(1)
 
-    typer.echo(f"正在生成超胞 (Scaling: {dim})...")
+    if min_radius is not None or max_atoms is not None:
+        from .supercell import find_supercell, inscribed_radius
+
+        lattice = structure.lattice.matrix
+        try:
+            found, radius = find_supercell(lattice, len(structure), min_radius=min_radius, max_atoms=max_atoms)
+        except ValueError as e:
+            typer.echo(f"错误: {e}", err=True)
+            raise typer.Exit(1)
+        diag_radius = float(inscribed_radius(np.array(matrix) @ lattice))
+        natoms = len(structure) * round(abs(np.linalg.det(found)))
+        typer.echo(f"对角超胞 {dim}: {len(structure) * round(abs(np.linalg.det(matrix)))} 原子, 内切球半径 {diag_radius:.3f} Å")
+        typer.echo(f"非对角超胞: {natoms} 原子, 内切球半径 {radius:.3f} Å")
+        for row in found:
+            typer.echo(f"  {row[0]:4d} {row[1]:4d} {row[2]:4d}")
+        matrix = found.tolist()
+        typer.echo("正在生成超胞 (Scaling: 上述变换矩阵)...")
+    else:
+        typer.echo(f"正在生成超胞 (Scaling: {dim})...")
     structure.make_supercell(matrix)
 
     gen_supercell_poscar(structure)
@@ -152,21 +176,39 @@ def main(
     # Actually, let's look at gen_alm_input in my code above. It hardcoded '1'. I should correct it to '3' or internal var.
     # I'll fix gen_alm_input to accept norder but default to None? No, hardcode 3.
 
-    # Also need to handle 'disp'. Original script had 'disp_magnitude_angstrom = 0.01'.
-    # But wait, where is 'disp' used?
-    # The provided User script DEFINED 'disp_magnitude_angstrom' but DID NOT USE IT in the provided functions!
-    # It might be used in a later step (e.g. displ.py) not shown, or implied.
-    # However, for 'suggest' mode in ALM, the displacements are usually generated by running 'alm' executable with 'suggest'.
-    # This python script only generates INPUT for ALM.
-    # So 'disp' might not be needed in ALM0.in?
-    # Checked ALM input format: &general section usually doesn't have displacement magnitude unless for other tools.
-    # But since user asked for 'disp_magnitude_angstrom' as a parameter, I should probably save it or use it?
-    # If the provided script didn't use it, I will define the option but print a warning or just keep it available.
-    # Or maybe I should check if I missed where it was used.
-    # 'gen_alm_input' args: filename, prefix, mode, structure, norder, str_cutoff, ndata, dfset.
-    # None of them seem to take disp.
-    # I will add the parameter to the CLI as requested, but if it's unused in the provided logic, I'll validly ignore it for now or log it.
-
     gen_alm_input("ALM0.in", prefix, "suggest", structure, str_cutoff=cutoff, norder=3)
 
-    typer.echo("任务完成。已生成: SPOSCAR, ALM0.in")
+    if not displace:
+        typer.echo("任务完成。已生成: SPOSCAR, ALM0.in")
+        return
+
+    from .displace import DIRLIST_NAME, MANIFEST_NAME, write_displaced
+
+    if shutil.which(alm) is None:
+        typer.echo(f"错误: 找不到 ALM 可执行文件 {alm}，可用 --alm 指定，或去掉 --displace 只生成输入", err=True)
+        raise typer.Exit(1)
+    typer.echo("正在运行 ALM suggest...")
+    try:
+        result = run_cmd([alm, "ALM0.in"])
+    except subprocess.CalledProcessError as e:
+        typer.echo(f"错误: ALM 运行失败: {e.stderr}", err=True)
+        raise typer.Exit(1)
+    Path("ALM0.log").write_text(result.stdout)
+
+    # 位移按超胞的笛卡尔坐标叠加，再换回分数坐标写出，保证位移大小精确为 disp
+    try:
+        entries = write_displaced(
+            out_dir,
+            prefix,
+            structure.lattice.matrix,
+            structure.cart_coords,
+            lambda frac_coords: _poscar_text(structure, frac_coords),
+            disp,
+            jobs=jobs,
+        )
+    except (FileNotFoundError, ValueError) as e:
+        typer.echo(f"错误: {e}", err=True)
+        raise typer.Exit(1)
+
+    typer.echo(f"任务完成。已生成: SPOSCAR, ALM0.in, {len(entries)} 个位移目录")
+    typer.echo(f"目录清单: {out_dir / DIRLIST_NAME}，位移详情: {out_dir / MANIFEST_NAME}")
@@ -1,74 +1,209 @@
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import typer
 from pathlib import Path
+from typing import List, Optional, Tuple
 import matplotlib.pyplot as plt
-import pandas as pd
+from matplotlib.collections import LineCollection
 import numpy as np
 
-# Although pandas/matplotlib are direct dependencies now,
+# Although matplotlib/numpy are direct dependencies now,
 # strictly following "Lazy Loading" rule in AI_RULES:
 # "如果用户选择懒加载... 严禁在该文件的顶层 global scope 进行 import"
 # BUT user chose "Direct Add" (A). So top level import is ALLOWED.
 # Proceeding with top level imports for better developer experience (type hints etc).
 
 
-def plot_scph_bands(file_path: Path):
-    if not file_path.exists():
-        typer.echo(f"错误: 文件不存在 {file_path}", err=True)
-        raise typer.Exit(1)
+CM_TO_THZ = 0.0299792458
+CACHE_VERSION = 1
+
+
+def _cache_path(file_path: Path) -> Path:
+    return file_path.with_name(f".{file_path.name}.npz")
+
+
+def _parse_table(file_path: Path) -> np.ndarray:
+    """
+    一次性把空白分隔的数值表解析成二维数组：去掉 # 注释后整体交给 np.fromstring，
+    空行被跳过。解析前逐行核对字段数，不规则的行不会被错位拼进其他行。
+    """
+    text = re.sub(r"#[^\n]*", "", file_path.read_text())
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        raise ValueError("文件中没有数据")
+    widths = {len(line.split()) for line in lines}
+    if len(widths) > 1:
+        raise ValueError(f"各行列数不一致 ({', '.join(map(str, sorted(widths)))} 列)")
+    ncols = widths.pop()
+    values = np.fromstring(text, sep=" ")
+    if values.size != ncols * len(lines):
+        raise ValueError("存在无法解析为数值的字段")
+    return values.reshape(-1, ncols)
 
-    file_name = file_path.stem
 
+def load_scph_bands(file_path: Path) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+    读取 SCPH 能带文件 (列: 温度, 路径坐标, 各支频率 cm^-1)，返回升序温度和
+    每个温度对应的行块（保持文件中的顺序）。解析结果缓存在同目录的
+    .<文件名>.npz 中，以源文件 mtime 和大小为键，源文件未变时直接读取缓存。
+    """
+    stat = file_path.stat()
+    key = np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    cache = _cache_path(file_path)
     try:
-        data = pd.read_csv(
-            file_path,
-            sep=r"\s+",
-            comment="#",
-            header=None,
-            skip_blank_lines=False,
-        )
-    except Exception as e:
-        typer.echo(f"读取文件失败: {e}", err=True)
-        raise typer.Exit(1)
+        with np.load(cache) as cached:
+            if np.array_equal(cached["key"], key):
+                data, counts = cached["data"], cached["counts"]
+                return cached["temps"], np.split(data, np.cumsum(counts)[:-1])
+    except (OSError, KeyError, ValueError):
+        pass
 
-    # Extract unique temperatures
-    # Column 0 is Temperature
+    table = _parse_table(file_path)
+    temps, inverse, counts = np.unique(table[:, 0], return_inverse=True, return_counts=True)
+    data = table[np.argsort(inverse, kind="stable")]
+    # 先写临时文件再原子替换，并发读取的进程不会看到写了一半的缓存
+    tmp = cache.with_name(f"{cache.stem}.{os.getpid()}.tmp.npz")
     try:
-        Ts = sorted(set(x for x in data[0] if pd.notna(x)))
-    except Exception as e:
-        typer.echo(f"数据解析失败: {e}", err=True)
-        raise typer.Exit(1)
+        np.savez(tmp, key=key, temps=temps, counts=counts, data=data)
+        os.replace(tmp, cache)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+    return temps, np.split(data, np.cumsum(counts)[:-1])
+
+
+def _downsample(block: np.ndarray, max_points: Optional[int]) -> np.ndarray:
+    """沿路径均匀抽取至多 max_points 个点，保留首尾"""
+    if not max_points or len(block) <= max_points:
+        return block
+    return block[np.unique(np.linspace(0, len(block) - 1, max_points).round().astype(int))]
+
+
+def _band_segments(block: np.ndarray) -> np.ndarray:
+    """一个温度下所有频率支的折线，形状 (支数, 点数, 2)"""
+    y = block[:, 2:].T * CM_TO_THZ
+    x = np.broadcast_to(block[:, 1], y.shape)
+    return np.stack((x, y), axis=-1)
+
+
+def render_scph_bands(file_path: Path, output_file: Path, max_points: Optional[int] = None) -> None:
+    """读取 (或命中缓存) 并绘制一个 SCPH 能带文件，保存为 output_file"""
+    Ts, blocks = load_scph_bands(file_path)
 
     cmap = plt.cm.YlOrRd
     colors = cmap(np.linspace(0, 1, len(Ts)))
 
-    plt.figure(figsize=(10, 8))
+    fig, ax = plt.subplots(figsize=(10, 8))
+
+    # 每个温度的所有频率支合并为一个 LineCollection，艺术家对象数与支数无关
+    for index, block in enumerate(blocks):
+        # Columns 0=T, 1=路径坐标, 2...=各支频率 (cm^-1)
+        segments = _band_segments(_downsample(block, max_points))
+        # 端点与拐角样式取 Line2D 的默认值，与逐条 plt.plot 的效果一致
+        ax.add_collection(
+            LineCollection(segments, colors=[colors[index]], capstyle="projecting", joinstyle="round")
+        )
+    ax.autoscale_view()
+
+    ax.set_xlabel("Index")
+    ax.set_ylabel("Frequency (THz)")  # 0.0299792458: cm^-1 -> THz
+    ax.set_title(f"Band Structure: {file_path.stem}")
+
+    try:
+        fig.savefig(output_file, dpi=300, bbox_inches="tight")
+    finally:
+        plt.close(fig)
+
 
-    # Plot data
-    for index, T in enumerate(Ts):
-        df = data[data[0] == T]
-        # Columns 0=T, 1=Index?, 2...=Frequencies?
-        # Script said: for i in range(2, df.shape[1]): plot(df[1], df[i] * factor)
-        for i in range(2, df.shape[1]):
-            plt.plot(df[1], df[i] * 0.0299792458, color=colors[index])
+def _init_worker() -> None:
+    # 每个工作进程独立使用无界面的 Agg 后端
+    plt.switch_backend("Agg")
 
-    plt.xlabel("Index")
-    plt.ylabel(
-        "Frequency (THz)"
-    )  # Added unit based on conversion factor (cm-1 to THz?) 0.0299... is cm-1 to THz usually ~0.029979.
-    plt.title(f"Band Structure: {file_name}")
 
-    output_file = Path(f"{file_name}.png")
-    plt.savefig(output_file, dpi=300, bbox_inches="tight")
-    plt.close()
+def _render_task(file_path: Path, output_file: Path, max_points: Optional[int]) -> Optional[str]:
+    """在工作进程中绘制一个文件，失败时返回错误信息而不是抛出异常"""
+    try:
+        render_scph_bands(file_path, output_file, max_points)
+    except (OSError, ValueError) as e:
+        return f"{file_path}: {e}"
+    return None
+
+
+def _collect_inputs(paths: List[Path], pattern: str) -> List[Path]:
+    """展开输入：目录递归查找 pattern，不存在的路径按 glob 展开"""
+    from mlkit.core.walk import scan_tree
 
-    typer.echo(f"图片已保存为: {output_file}")
+    files: List[Path] = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(scan_tree(path, pattern))
+        elif path.exists():
+            files.append(path)
+        else:
+            matches = sorted(Path(p) for p in glob.glob(str(path), recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"文件不存在 {path}")
+            files.extend(p for p in matches if p.is_file())
+    return list(dict.fromkeys(files))
 
 
 def main(
-    file_path: Path = typer.Argument(..., help="SCPH 能带数据文件路径"),
+    inputs: List[Path] = typer.Argument(..., help="SCPH 能带数据文件、目录或 glob"),
+    max_points: Optional[int] = typer.Option(None, "--max-points", help="每条频率支沿路径最多绘制的点数，缺省不抽稀"),
+    out_dir: Path = typer.Option(Path("."), "--out-dir", "-o", help="图片输出目录"),
+    pattern: str = typer.Option("*.scph_bands", "--pattern", help="在目录中查找的文件名模式"),
+    jobs: int = typer.Option(1, "-j", "--jobs", help="并行绘图的进程数"),
+    force: bool = typer.Option(False, "--force", help="即使图片比数据新也重新绘制"),
 ):
     """
     绘制 SCPH 修正后的声子谱 (Band Structure)。
-    自动读取数据并保存为 PNG 图片，不显示弹窗。
+    自动读取数据并保存为 PNG 图片，不显示弹窗。可一次处理多个文件，
+    图片比数据文件新时跳过。
     """
-    plot_scph_bands(file_path)
+    try:
+        files = _collect_inputs(inputs, pattern)
+    except FileNotFoundError as e:
+        typer.echo(f"错误: {e}", err=True)
+        raise typer.Exit(1)
+    if not files:
+        typer.echo("错误: 没有找到 SCPH 能带文件", err=True)
+        raise typer.Exit(1)
+
+    outputs = [out_dir / f"{f.stem}.png" for f in files]
+    duplicates = sorted({str(o) for o in outputs if outputs.count(o) > 1})
+    if duplicates:
+        typer.echo(f"错误: 多个输入会写到同一图片: {' '.join(duplicates)}", err=True)
+        raise typer.Exit(1)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    tasks = [
+        (f, o)
+        for f, o in zip(files, outputs)
+        if force or not o.exists() or o.stat().st_mtime_ns < f.stat().st_mtime_ns
+    ]
+    if len(tasks) < len(files):
+        typer.echo(f"跳过 {len(files) - len(tasks)} 个已是最新的图片")
+
+    errors: List[str] = []
+
+    def report(error: Optional[str], output_file: Path) -> None:
+        if error:
+            errors.append(error)
+        else:
+            typer.echo(f"图片已保存为: {output_file}")
+
+    if jobs <= 1:
+        _init_worker()
+        for f, o in tasks:
+            report(_render_task(f, o, max_points), o)
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+            futures = {pool.submit(_render_task, f, o, max_points): o for f, o in tasks}
+            for future in as_completed(futures):
+                report(future.result(), futures[future])
+
+    if errors:
+        for error in errors:
+            typer.echo(f"绘图失败: {error}", err=True)
+        raise typer.Exit(1)
@@ -0,0 +1,197 @@
+import json
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import typer
+from mlkit.core.shell import run_cmd
+from mlkit.core.vasprun import is_finished
+
+from .submit_job import _write_script
+
+app = typer.Typer(help="AMSET 形变势计算：生成、并行提交与读取")
+
+MANIFEST_NAME = "manifest.json"
+INPUT_FILES = ("INCAR", "KPOINTS", "POTCAR")
+
+
+def _load_manifest(directory: Path) -> Dict[str, Any]:
+    manifest_path = directory / MANIFEST_NAME
+    if not manifest_path.is_file():
+        typer.echo(f"错误: 找不到 {manifest_path}，请先运行 deform create", err=True)
+        raise typer.Exit(1)
+    return json.loads(manifest_path.read_text())
+
+
+def _save_manifest(directory: Path, manifest: Dict[str, Any]) -> None:
+    (directory / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+
+
+def _prepare_dir(job_dir: Path, structure: Any, jobscript: Path) -> None:
+    job_dir.mkdir(parents=True, exist_ok=True)
+    structure.to(filename=str(job_dir / "POSCAR"), fmt="poscar")
+    for name in INPUT_FILES:
+        shutil.copy2(name, job_dir / name)
+    shutil.copy2(jobscript, job_dir / "jobscript.sh")
+
+
+def _qsub(job_dir: Path) -> Tuple[str, Optional[str]]:
+    """
+    提交一个形变作业，返回 (作业号, 错误信息)。失败或 qsub 没有输出作业号时返回错误而不是抛出，
+    已提交的其余作业仍会记入 manifest。
+    """
+    try:
+        result = run_cmd(["qsub", "jobscript.sh"], cwd=str(job_dir))
+    except subprocess.CalledProcessError as e:
+        return "", (e.stderr or str(e)).strip()
+    except OSError as e:
+        return "", str(e)
+    job_id = (result.stdout or "").strip()
+    return job_id, None if job_id else "qsub 未返回作业号"
+
+
+def _qsub_dependent(directory: Path, script: Path, depend: str) -> str:
+    result = run_cmd(["qsub", "-W", f"depend={depend}", script.name], cwd=str(directory))
+    return (result.stdout or "").strip()
+
+
+def _update_status(directory: Path, manifest: Dict[str, Any]) -> List[str]:
+    """根据 vasprun.xml 更新完成状态，返回尚未完成的目录"""
+    pending = []
+    for name, entry in manifest["jobs"].items():
+        vasprun = directory / name / "vasprun.xml"
+        if vasprun.is_file() and is_finished(vasprun):
+            entry["status"] = "finished"
+        else:
+            pending.append(name)
+    return pending
+
+
+def _read_args(manifest: Dict[str, Any]) -> List[str]:
+    names = sorted(manifest["jobs"])
+    return ["deform", "read", "--symprec", manifest["symprec"], *names, "-o", manifest["output"]]
+
+
+@app.command(name="create")
+def create(
+    poscar: Path = typer.Option(Path("POSCAR"), "--poscar", help="未形变结构文件"),
+    jobscript: Path = typer.Option(Path("jobscript.sh"), "--jobscript", help="单个形变计算的作业脚本"),
+    directory: Path = typer.Option(Path("deforms"), "--directory", help="形变计算输出目录"),
+    distance: float = typer.Option(0.005, "-d", "--distance", help="应变大小 (fractional)"),
+    symprec: str = typer.Option("0.01", "-s", "--symprec", help="对称性精度，'N' 表示不约化"),
+    amset_path: str = typer.Option("amset", "--amset-path", help="amset 可执行路径"),
+    output: str = typer.Option("deformation.h5", "-o", "--output", help="deform read 的输出文件"),
+    workers: int = typer.Option(8, "-j", "--jobs", help="并行准备/提交的线程数"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="无需确认直接提交"),
+) -> None:
+    """
+    用 amset Python API 生成形变结构，每个形变一个目录并行准备、并行提交，
+    并提交一个依赖全部形变作业的 amset deform read 作业。
+    """
+    from amset.deformation.generation import get_deformations, get_deformed_structures
+    from pymatgen.core.structure import Structure
+    from pymatgen.core.tensors import symmetry_reduce
+
+    for path in (poscar, jobscript, *map(Path, INPUT_FILES)):
+        if not path.is_file():
+            typer.echo(f"错误: 找不到文件 {path}", err=True)
+            raise typer.Exit(1)
+
+    structure = Structure.from_file(poscar)
+    deformations = get_deformations(distance)
+    typer.echo(f"Total deformations: {len(deformations)}")
+    if symprec.upper() != "N":
+        deformations = list(symmetry_reduce(deformations, structure, symprec=float(symprec)))
+        typer.echo(f"Inequivalent deformations: {len(deformations)}")
+
+    # 第 0 个目录为未形变的 bulk 计算
+    structures = [structure, *get_deformed_structures(structure, deformations)]
+    width = len(str(len(deformations))) + 1
+    names = [f"job{i:0{width}d}" for i in range(len(structures))]
+
+    directory.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda n, s: _prepare_dir(directory / n, s, jobscript), names, structures))
+
+    manifest: Dict[str, Any] = {
+        "distance": distance,
+        "symprec": symprec,
+        "output": output,
+        "jobs": {name: {"job_id": None, "status": "prepared"} for name in names},
+        "read_job_id": None,
+    }
+    _save_manifest(directory, manifest)
+    typer.echo(f"已在 {directory} 生成 {len(names)} 个计算目录 (含 bulk {names[0]})")
+
+    if not (yes or typer.confirm(f"提交 {len(names)} 个形变作业？")):
+        return
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lambda n: _qsub(directory / n), names))
+    failed = []
+    for name, (job_id, error) in zip(names, results):
+        if error is None:
+            manifest["jobs"][name].update(job_id=job_id, status="submitted")
+        else:
+            typer.echo(f"提交失败 {name}: {error}", err=True)
+            failed.append(name)
+    _save_manifest(directory, manifest)
+    if failed:
+        # 依赖作业需要全部形变作业的作业号，缺任何一个都不提交，避免 depend 不完整
+        typer.echo(
+            f"错误: {len(failed)} 个形变作业提交失败，未提交 deform read 作业；"
+            f"已提交的作业号已记入 {directory / MANIFEST_NAME}",
+            err=True,
+        )
+        raise typer.Exit(1)
+
+    job_ids = [job_id for job_id, _ in results]
+    read_script = directory / "deform_read.sh"
+    _write_script(amset_path, read_script, " ".join(_read_args(manifest)))
+    try:
+        manifest["read_job_id"] = _qsub_dependent(directory, read_script, "afterok:" + ":".join(job_ids))
+    except subprocess.CalledProcessError as e:
+        typer.echo(f"错误: deform read 作业提交失败: {(e.stderr or str(e)).strip()}", err=True)
+        raise typer.Exit(1)
+    _save_manifest(directory, manifest)
+    typer.echo(f"已提交 {len(job_ids)} 个形变作业，deform read 作业 {manifest['read_job_id']} 将在其后运行")
+
+
+@app.command(name="status")
+def status(
+    directory: Path = typer.Option(Path("deforms"), "--directory", help="形变计算目录"),
+) -> None:
+    """
+    检查各形变计算是否完成并更新 manifest。
+    """
+    manifest = _load_manifest(directory)
+    pending = _update_status(directory, manifest)
+    _save_manifest(directory, manifest)
+
+    total = len(manifest["jobs"])
+    typer.echo(f"已完成 {total - len(pending)}/{total}")
+    if pending:
+        typer.echo(f"未完成: {' '.join(pending)}")
+    elif (directory / manifest["output"]).is_file():
+        typer.echo(f"形变势已写出: {directory / manifest['output']}")
+
+
+@app.command(name="read")
+def read(
+    directory: Path = typer.Option(Path("deforms"), "--directory", help="形变计算目录"),
+    amset_path: Optional[str] = typer.Option("amset", "--amset-path", help="amset 可执行路径"),
+) -> None:
+    """
+    所有形变计算完成后在本地运行 amset deform read（用于未提交依赖作业的情况）。
+    """
+    manifest = _load_manifest(directory)
+    pending = _update_status(directory, manifest)
+    _save_manifest(directory, manifest)
+    if pending:
+        typer.echo(f"错误: 仍有 {len(pending)} 个计算未完成: {' '.join(pending)}", err=True)
+        raise typer.Exit(1)
+
+    run_cmd([amset_path or "amset", *_read_args(manifest)], cwd=str(directory))
+    typer.echo(f"形变势已写出: {directory / manifest['output']}")
@@ -7,7 +7,7 @@ from mlkit.core.shell import run_cmd
 app = typer.Typer(help="生成并提交 AMSET PBS 作业脚本")
 
 
-def _write_script(amset_path: str, script_path: Path) -> None:
+def _write_script(amset_path: str, script_path: Path, args: str = "run") -> None:
     content = f"""#!/bin/bash
 #PBS -S /bin/bash
 #PBS -l walltime=600:00:00
@@ -20,7 +20,7 @@ cd ${{PBS_O_WORKDIR}}
 
 export OMP_NUM_THREADS=1
 
-{amset_path} run
+{amset_path} {args}
 """
     script_path.write_text(content, encoding="utf-8")
 
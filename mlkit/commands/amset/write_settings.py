@@ -5,7 +5,8 @@ from typing import Dict
 import numpy as np
 import typer
 import yaml
-from pymatgen.io.vasp.outputs import Outcar, Vasprun
+from mlkit.core.outcar import read_outcar_elastic
+from pymatgen.io.vasp.outputs import Vasprun
 
 app = typer.Typer(help="生成 AMSET settings.yaml")
 
@@ -207,9 +208,12 @@ def _write_settings(
     static_dielectric = np.array(Vasprun(dfpt_vasprun).epsilon_ionic) + np.array(
         Vasprun(dfpt_vasprun).epsilon_static
     )
-    elastic_outcar_obj = Outcar(elastic_outcar)
-    elastic_outcar_obj.read_elastic_tensor()
-    elastic_constant = elastic_outcar_obj.data["elastic_tensor"]
+    # 只从 OUTCAR 末尾反向读取弹性张量表，不解析整个文件
+    elastic_tensor = read_outcar_elastic(elastic_outcar)
+    if elastic_tensor is None:
+        typer.echo(f"错误: {elastic_outcar} 中没有 TOTAL ELASTIC MODULI", err=True)
+        raise typer.Exit(1)
+    elastic_constant = elastic_tensor.tolist()
 
     AMSET_SETTINGS["wavefunction_coefficients"] = wavefunction_hdf5.absolute().as_posix()
     AMSET_SETTINGS["deformation_potential"] = deform_hdf5.absolute().as_posix()
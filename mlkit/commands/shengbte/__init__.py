@@ -1,8 +1,8 @@
 import typer
 
-from . import write_control
+from . import sweep, write_control
 
 app = typer.Typer(help="ShengBTE 相关工具")
 
 app.command(name="write-control")(write_control.main)
-
+app.add_typer(sweep.app, name="sweep")
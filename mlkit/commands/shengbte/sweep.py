@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import typer
+from mlkit.core.shell import run_cmd
+
+from .write_control import build_control, parse_ngrid, read_born
+
+app = typer.Typer(help="ShengBTE 收敛性测试")
+
+MANIFEST_NAME = "sweep.json"
+KAPPA_NAME = "BTE.kappa"
+
+
+def _variant_name(ngrid: List[int], scalebroad: float) -> str:
+    return f"ngrid-{'x'.join(map(str, ngrid))}_sb-{scalebroad:g}"
+
+
+def _link(src: Path, dst: Path) -> None:
+    """用相对路径软链接，整个测试目录移动后仍有效"""
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+    dst.symlink_to(os.path.relpath(src.resolve(), dst.parent.resolve()))
+
+
+def _submit(cwd: Path, jobscript: str) -> Tuple[str, Optional[str]]:
+    """
+    提交一个组合的作业，返回 (作业号, 错误信息)。与 vasp 作业一致，
+    先取消 qsub.pid 中记录的旧作业；失败时返回错误而不是抛出，其余组合照常提交。
+    """
+    pid_file = cwd / "qsub.pid"
+    try:
+        if pid_file.is_file():
+            old_pid = pid_file.read_text().strip()
+            if old_pid:
+                run_cmd(["qdel", old_pid], cwd=str(cwd), check=False)
+        result = run_cmd(["qsub", jobscript], cwd=str(cwd))
+    except subprocess.CalledProcessError as e:
+        return "", (e.stderr or str(e)).strip()
+    except OSError as e:
+        return "", str(e)
+    pid = (result.stdout or "").strip()
+    if pid:
+        pid_file.write_text(pid)
+    return pid, None
+
+
+@app.command(name="run")
+def run(
+    poscar: Path = typer.Argument(..., help="POSCAR 文件路径"),
+    sx: int = typer.Argument(..., help="超胞尺寸 x (scell[0])"),
+    sy: int = typer.Argument(..., help="超胞尺寸 y (scell[1])"),
+    sz: int = typer.Argument(..., help="超胞尺寸 z (scell[2])"),
+    ngrids: List[str] = typer.Option(["10", "15", "20"], "--ngrid", help="q 点网格，可多次给出，如 15 或 15,15,20"),
+    scalebroads: List[float] = typer.Option([0.5], "--scalebroad", help="展宽缩放因子，可多次给出"),
+    force_constants: List[Path] = typer.Option(
+        [Path("FORCE_CONSTANTS_2ND"), Path("FORCE_CONSTANTS_3RD")], "--fc", help="链接到各目录的力常数文件"
+    ),
+    is_born: bool = typer.Option(False, "--is-born", help="是否启用 Born 有效电荷，需要 OUTCAR"),
+    outcar: Optional[Path] = typer.Option(None, "--outcar", help="OUTCAR 路径，启用 --is-born 必填"),
+    out_dir: Path = typer.Option(Path("sweep"), "--out-dir", help="收敛测试根目录"),
+    jobscript: Optional[Path] = typer.Option(None, "--jobscript", help="复制到各目录的作业脚本"),
+    submit: bool = typer.Option(False, "--submit", help="生成后用 qsub 并行提交所有作业"),
+    jobs: int = typer.Option(8, "-j", "--jobs", help="并行提交的线程数"),
+) -> None:
+    """
+    按 q 点网格与展宽的组合生成一组 CONTROL，每个组合一个目录，
+    力常数文件以软链接共享，可选并行提交。
+    """
+    from pymatgen.core.structure import Structure
+
+    if not poscar.is_file():
+        typer.echo(f"错误: 找不到文件 {poscar}", err=True)
+        raise typer.Exit(1)
+    missing = [str(fc) for fc in force_constants if not fc.is_file()]
+    if missing:
+        typer.echo(f"错误: 找不到力常数文件 {' '.join(missing)}", err=True)
+        raise typer.Exit(1)
+    if submit and jobscript is None:
+        typer.echo("错误: --submit 需要 --jobscript", err=True)
+        raise typer.Exit(1)
+    try:
+        grids = [parse_ngrid(text) for text in ngrids]
+    except ValueError as e:
+        typer.echo(f"错误: {e}", err=True)
+        raise typer.Exit(1)
+
+    born = epsilon = None
+    if is_born:
+        if outcar is None:
+            typer.echo("错误: 启用 --is-born 时必须提供 --outcar", err=True)
+            raise typer.Exit(1)
+        born, epsilon = read_born(outcar)
+
+    structure = Structure.from_file(poscar)
+    variants: Dict[str, Dict[str, Any]] = {}
+    for ngrid, scalebroad in product(grids, scalebroads):
+        name = _variant_name(ngrid, scalebroad)
+        cwd = out_dir / name
+        cwd.mkdir(parents=True, exist_ok=True)
+        with (cwd / "CONTROL").open("w") as f:
+            build_control(structure, (sx, sy, sz), ngrid, scalebroad, born, epsilon).write(f)
+        for fc in force_constants:
+            _link(fc, cwd / fc.name)
+        if jobscript is not None:
+            shutil.copy2(jobscript, cwd / jobscript.name)
+        variants[name] = {"ngrid": ngrid, "scalebroad": scalebroad}
+
+    # 合并进已有清单，分几次运行加入的组合都能被 collect 汇总
+    manifest = out_dir / MANIFEST_NAME
+    merged = json.loads(manifest.read_text()) if manifest.is_file() else {}
+    merged.update(variants)
+    manifest.write_text(json.dumps(merged, indent=2))
+    typer.echo(f"已在 {out_dir} 生成 {len(variants)} 组 CONTROL，清单共 {len(merged)} 组")
+
+    if submit:
+        names = list(variants)
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            results = list(pool.map(lambda name: _submit(out_dir / name, jobscript.name), names))
+        failed = []
+        for name, (pid, error) in zip(names, results):
+            if error is None:
+                typer.echo(f"已提交 {name}: {pid}")
+            else:
+                typer.echo(f"提交失败 {name}: {error}", err=True)
+                failed.append(name)
+        if failed:
+            typer.echo(f"错误: {len(failed)} 个组合提交失败", err=True)
+            raise typer.Exit(1)
+
+
+def _read_kappa(path: Path) -> np.ndarray:
+    """BTE.kappa 每行为 迭代步 + 9 个热导率张量分量，取最后一行 (最终收敛值)"""
+    rows = np.loadtxt(path, ndmin=2)
+    if not len(rows):
+        raise ValueError(f"{path} 为空")
+    return rows[-1, -9:].reshape(3, 3)
+
+
+def _kappa_files(cwd: Path) -> List[Tuple[float, Path]]:
+    """(温度, BTE.kappa)。设置 T_min/T_max 时 ShengBTE 把各温度结果写在 T<温度>K 子目录"""
+    found = []
+    for sub in cwd.glob("T*K"):
+        kappa = sub / KAPPA_NAME
+        if kappa.is_file():
+            found.append((float(sub.name[1:-1]), kappa))
+    if (cwd / KAPPA_NAME).is_file():
+        found.append((np.nan, cwd / KAPPA_NAME))
+    return sorted(found, key=lambda item: item[0])
+
+
+@app.command(name="collect")
+def collect(
+    out_dir: Path = typer.Option(Path("sweep"), "--out-dir", help="收敛测试根目录"),
+    output: Path = typer.Option(Path("kappa_convergence.tsv"), "-o", "--output", help="汇总表"),
+) -> None:
+    """
+    读取收敛测试各目录的 BTE.kappa，汇总为一张表 (每行一个组合和温度)。
+    """
+    manifest = out_dir / MANIFEST_NAME
+    if not manifest.is_file():
+        typer.echo(f"错误: 找不到 {manifest}，请先运行 sweep run", err=True)
+        raise typer.Exit(1)
+    variants = json.loads(manifest.read_text())
+
+    lines = ["variant\tngrid\tscalebroad\tT\tkxx\tkyy\tkzz\tkavg"]
+    pending = []
+    for name, params in variants.items():
+        files = _kappa_files(out_dir / name)
+        if not files:
+            pending.append(name)
+            continue
+        for temperature, path in files:
+            try:
+                kappa = _read_kappa(path)
+            except ValueError as e:
+                typer.echo(f"跳过 {e}", err=True)
+                continue
+            kxx, kyy, kzz = np.diag(kappa)
+            lines.append(
+                f"{name}\t{'x'.join(map(str, params['ngrid']))}\t{params['scalebroad']:g}\t{temperature:g}\t"
+                f"{kxx:.6g}\t{kyy:.6g}\t{kzz:.6g}\t{np.trace(kappa) / 3:.6g}"
+            )
+
+    output.write_text("\n".join(lines) + "\n")
+    typer.echo("\n".join(lines))
+    if pending:
+        typer.echo(f"尚无结果的组合 ({len(pending)}): {' '.join(pending)}", err=True)
+    typer.echo(f"已写出 {output}")
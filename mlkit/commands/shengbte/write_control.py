@@ -1,45 +1,46 @@
 from pathlib import Path
-from typing import Optional
+from typing import Any, List, Optional, Sequence, Tuple
 
 import typer
 
 app = typer.Typer(help="生成 ShengBTE CONTROL 文件")
 
 
-@app.command(name="main")
-def main(
-    poscar: Path = typer.Argument(..., help="POSCAR 文件路径"),
-    sx: int = typer.Argument(..., help="超胞尺寸 x (scell[0])"),
-    sy: int = typer.Argument(..., help="超胞尺寸 y (scell[1])"),
-    sz: int = typer.Argument(..., help="超胞尺寸 z (scell[2])"),
-    is_born: bool = typer.Option(False, "--is-born", help="是否启用 Born 有效电荷，需要 OUTCAR"),
-    outcar: Optional[Path] = typer.Option(None, "--outcar", help="OUTCAR 路径，启用 --is-born 必填"),
-    output: Path = typer.Option(Path("CONTROL"), "-o", "--output", help="输出 CONTROL 文件路径"),
-) -> None:
-    """
-    根据 POSCAR 与超胞尺寸生成 ShengBTE CONTROL 文件。
-    """
-    # 懒加载依赖以降低启动成本
+def parse_ngrid(text: str) -> List[int]:
+    """"15" 表示 15x15x15，"15,15,20" 或 "15x15x20" 为各方向分别指定"""
+    try:
+        values = [int(v) for v in text.replace("x", ",").split(",") if v.strip()]
+    except ValueError:
+        values = []
+    if len(values) == 1:
+        values *= 3
+    if len(values) != 3 or min(values) < 1:
+        raise ValueError(f"无法解析 q 点网格: {text}")
+    return values
+
+
+def read_born(outcar: Path) -> Tuple[Any, Any]:
+    """从 OUTCAR 末尾反向定位并只读取最后一组 Born 有效电荷与介电张量"""
+    from mlkit.core.outcar import read_outcar_lepsilon
+
+    if not outcar.is_file():
+        raise FileNotFoundError(f"OUTCAR not found: {outcar}")
+    born, epsilon = read_outcar_lepsilon(outcar)
+    if born is None or epsilon is None:
+        raise ValueError(f"{outcar} 中没有 BORN EFFECTIVE CHARGES 或 MACROSCOPIC STATIC DIELECTRIC TENSOR")
+    return born, epsilon.tolist()
+
+
+def build_control(
+    structure: Any,
+    scell: Sequence[int],
+    ngrid: Sequence[int] = (15, 15, 15),
+    scalebroad: float = 0.5,
+    born: Any = None,
+    epsilon: Any = None,
+) -> Any:
+    """由结构与参数构造 CONTROL 的 f90nml.Namelist"""
     import f90nml  # type: ignore
-    from pymatgen.core.structure import Structure
-    from pymatgen.io.vasp.outputs import Outcar
-
-    if not poscar.is_file():
-        raise FileNotFoundError(f"POSCAR not found: {poscar}")
-
-    born = None
-    epsilon = None
-    if is_born:
-        if outcar is None:
-            raise ValueError("启用 --is-born 时必须提供 --outcar")
-        if not outcar.is_file():
-            raise FileNotFoundError(f"OUTCAR not found: {outcar}")
-        outcar_obj = Outcar(outcar)
-        born = outcar_obj.born
-        epsilon = outcar_obj.dielectric_tensor
-
-    structure = Structure.from_file(poscar)
-    scell = (sx, sy, sz)
 
     nml = f90nml.Namelist()
 
@@ -50,7 +51,7 @@ def main(
     nml["allocations"] = {
         "nelements": nelements,
         "natoms": natoms,
-        "ngrid": [15, 15, 15],
+        "ngrid": list(ngrid),
     }
 
     latt = structure.lattice.matrix
@@ -73,15 +74,52 @@ def main(
         "T_min": 300,
         "T_max": 900,
         "T_step": 100,
-        "scalebroad": 0.5,
+        "scalebroad": scalebroad,
     }
 
     nml["flags"] = {
         "convergence": True,
     }
+    return nml
+
+
+@app.command(name="main")
+def main(
+    poscar: Path = typer.Argument(..., help="POSCAR 文件路径"),
+    sx: int = typer.Argument(..., help="超胞尺寸 x (scell[0])"),
+    sy: int = typer.Argument(..., help="超胞尺寸 y (scell[1])"),
+    sz: int = typer.Argument(..., help="超胞尺寸 z (scell[2])"),
+    is_born: bool = typer.Option(False, "--is-born", help="是否启用 Born 有效电荷，需要 OUTCAR"),
+    outcar: Optional[Path] = typer.Option(None, "--outcar", help="OUTCAR 路径，启用 --is-born 必填"),
+    output: Path = typer.Option(Path("CONTROL"), "-o", "--output", help="输出 CONTROL 文件路径"),
+    ngrid: str = typer.Option("15", "--ngrid", help="q 点网格，如 15 或 15,15,20"),
+    scalebroad: float = typer.Option(0.5, "--scalebroad", help="高斯展宽缩放因子"),
+) -> None:
+    """
+    根据 POSCAR 与超胞尺寸生成 ShengBTE CONTROL 文件。
+    """
+    # 懒加载依赖以降低启动成本
+    from pymatgen.core.structure import Structure
+
+    if not poscar.is_file():
+        raise FileNotFoundError(f"POSCAR not found: {poscar}")
+    try:
+        grid = parse_ngrid(ngrid)
+    except ValueError as e:
+        typer.echo(f"错误: {e}", err=True)
+        raise typer.Exit(1)
+
+    born = None
+    epsilon = None
+    if is_born:
+        if outcar is None:
+            raise ValueError("启用 --is-born 时必须提供 --outcar")
+        born, epsilon = read_born(outcar)
+
+    structure = Structure.from_file(poscar)
+    nml = build_control(structure, (sx, sy, sz), grid, scalebroad, born, epsilon)
 
     with output.open("w") as f:
         nml.write(f)
 
     typer.echo(f"已写出 ShengBTE CONTROL 至 {output}")
-
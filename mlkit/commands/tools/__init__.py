@@ -1,8 +1,8 @@
 import typer
 
-from . import xml2xyz
+from . import convert_dataset, xml2xyz
 
 app = typer.Typer(help="通用小工具集合")
 
 app.command(name="xml2xyz")(xml2xyz.main)
-
+app.command(name="convert-dataset")(convert_dataset.main)
@@ -0,0 +1,64 @@
+import shutil
+from pathlib import Path
+
+import typer
+from mlkit.core.dataset import DatasetWriter, atoms_to_batch, format_extxyz, frame_batch, is_dataset, load_dataset
+
+app = typer.Typer(help="extxyz 与列式数据集互相转换")
+
+
+def _xyz_to_columnar(input_path: Path, output: Path) -> int:
+    from ase.io import iread
+
+    nframes = 0
+    with DatasetWriter(output) as writer:
+        for atoms in iread(input_path, index=":", format="extxyz"):
+            nframes += writer.append(atoms_to_batch([atoms]))
+    return nframes
+
+
+def _columnar_to_xyz(input_path: Path, output: Path) -> int:
+    data = load_dataset(input_path)
+    nframes = len(data["energy"])
+    with output.open("w") as f:
+        with typer.progressbar(range(nframes), label="写出中") as progress:
+            for i in progress:
+                f.write(format_extxyz(frame_batch(data, i)))
+    return nframes
+
+
+@app.command(name="main")
+def main(
+    input_path: Path = typer.Argument(..., help="输入 extxyz 文件或列式数据集目录"),
+    output: Path = typer.Argument(..., help="输出路径"),
+    force: bool = typer.Option(False, "--force", help="覆盖已存在的输出文件或列式数据集"),
+) -> None:
+    """
+    extxyz 与列式数据集 (xml2xyz --format columnar) 互相转换，方向由输入自动判断。
+    列式数据集转出的 extxyz 与 xml2xyz 直接写出的逐字节一致。
+    """
+    if output.exists():
+        if output.resolve() == input_path.resolve():
+            typer.echo("错误: 输出路径与输入相同", err=True)
+            raise typer.Exit(1)
+        if not force:
+            typer.echo(f"错误: {output} 已存在，使用 --force 覆盖", err=True)
+            raise typer.Exit(1)
+        if output.is_dir():
+            # 只删除列式数据集目录，避免误删任意目录（如当前目录）
+            if not is_dataset(output):
+                typer.echo(f"错误: {output} 是目录但不是列式数据集，拒绝覆盖", err=True)
+                raise typer.Exit(1)
+            shutil.rmtree(output)
+        else:
+            output.unlink()
+
+    if is_dataset(input_path):
+        nframes = _columnar_to_xyz(input_path, output)
+        typer.echo(f"已写入 {nframes} 个结构到 {output}。")
+    elif input_path.is_file():
+        nframes = _xyz_to_columnar(input_path, output)
+        typer.echo(f"已写入 {nframes} 个结构到列式数据集 {output}。")
+    else:
+        typer.echo(f"错误: {input_path} 既不是 extxyz 文件也不是列式数据集", err=True)
+        raise typer.Exit(1)
@@ -1,55 +1,483 @@
+import hashlib
+import json
+import os
+import shutil
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import numpy as np
 import typer
+from ase import units
 from ase.io import read
-from ase.io.extxyz import write_extxyz
+from ase.io.formats import string2index
+from mlkit.core.dedup import FrameDeduplicator
+from mlkit.core.dataset import (
+    FRAME_INDEX_KEY,
+    DatasetWriter,
+    ShardedWriter,
+    atoms_to_batch,
+    format_extxyz,
+    is_dataset,
+)
+from mlkit.core.outcar import read_outcar_trajectory
+from mlkit.core.parallel import imap_chunks
+from mlkit.core.vasprun import ATOM_KEYS, FRAME_KEYS, read_trajectory
+from mlkit.core.walk import scan_tree
 
 app = typer.Typer(help="vasprun.xml 转换/合并为 extxyz 格式")
 
+HASH_BLOCK = 1 << 20
 
-def _process_file(file_path: Path) -> List:
-    """读取单个文件并返回 Atoms 对象列表"""
+
+def _take(batch: Dict[str, Any], idx: np.ndarray) -> Dict[str, Any]:
+    keys = (*FRAME_KEYS, FRAME_INDEX_KEY) if FRAME_INDEX_KEY in batch else FRAME_KEYS
+    shared = {key: batch[key] for key in ATOM_KEYS if key in batch}
+    return {**shared, **{key: batch[key][idx] for key in keys}}
+
+
+def _select_frames(
+    batch: Dict[str, Any],
+    fmax: Optional[float] = None,
+    emin: Optional[float] = None,
+    emax: Optional[float] = None,
+    smax: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    按最大原子力 (eV/Å)、每原子能量 (eV/atom) 和最大应力分量 (GPa) 筛选结构。
+    直接在整个文件的帧数组上比较，缺失的量 (NaN) 不参与筛选。
+    """
+    keep = np.ones(len(batch["energies"]), dtype=bool)
+
+    epa = batch["energies"] / len(batch["symbols"])
+    if emin is not None:
+        keep &= epa >= emin
+    if emax is not None:
+        keep &= epa <= emax
+
+    if fmax is not None:
+        keep &= ~(np.linalg.norm(batch["forces"], axis=2).max(axis=1, initial=0.0) > fmax)
+
+    if smax is not None:
+        keep &= ~(np.abs(batch["stresses"] / units.GPa).max(axis=(1, 2)) > smax)
+
+    return _take(batch, keep)
+
+
+def _read_fast(file_path: Path) -> Dict[str, Any]:
+    """
+    读取 vasprun.xml 或 OUTCAR。vasprun.xml 无法读取或被截断（作业被杀、超时）时，
+    若同目录有 OUTCAR 且能恢复更多已完成的离子步，则改用 OUTCAR 的结果。
+    """
+    if "OUTCAR" in file_path.name:
+        return read_outcar_trajectory(file_path)
+
+    outcar = file_path.parent / "OUTCAR"
+    try:
+        batch: Optional[Dict[str, Any]] = read_trajectory(file_path)
+    except Exception:
+        if not outcar.is_file():
+            raise
+        batch = None
+
+    if (batch is None or batch["truncated"]) and outcar.is_file():
+        recovered = read_outcar_trajectory(outcar)
+        if batch is None or len(recovered["energies"]) > len(batch["energies"]):
+            typer.echo(f"{file_path} 不完整，从 OUTCAR 恢复 {len(recovered['energies'])} 个离子步", err=True)
+            if batch is not None:
+                # OUTCAR 不含 selective dynamics，沿用 vasprun.xml 中读到的固定原子
+                recovered["move_mask"] = batch["move_mask"]
+            return recovered
+    return batch
+
+
+def _read_batch(file_path: Path, index: str, reader: str) -> Dict[str, Any]:
+    """读取指定离子步，并记录每帧在源文件中的原始编号 (供数据集划分使用)"""
+    if reader == "ase":
+        frames = read(file_path, index=":")
+        idx = np.atleast_1d(np.arange(len(frames))[string2index(index)])
+        batch = atoms_to_batch([frames[i] for i in idx])
+    else:
+        batch = _read_fast(file_path)
+        idx = np.atleast_1d(np.arange(len(batch["energies"]))[string2index(index)])
+        batch = _take(batch, idx)
+    batch[FRAME_INDEX_KEY] = idx
+    return batch
+
+
+def _process_file(
+    file_path: Path,
+    index: str = "-1",
+    stride: int = 1,
+    filters: Optional[Dict[str, Optional[float]]] = None,
+    reader: str = "fast",
+) -> Optional[Dict[str, Any]]:
+    """读取单个文件的指定离子步，筛选后返回帧数组批次"""
     try:
-        atoms = read(file_path)
-        return [atoms]
+        batch = _read_batch(file_path, index, reader)
     except Exception as exc:
         typer.echo(f"读取失败 {file_path}: {exc}", err=True)
-        return []
+        return None
+
+    batch = _take(batch, slice(None, None, stride))
+    return _select_frames(batch, **(filters or {}))
+
+
+def _process_chunk(
+    chunk: List[Path],
+    index: str,
+    stride: int,
+    filters: Optional[Dict[str, Optional[float]]],
+    reader: str,
+) -> List[Optional[Dict[str, Any]]]:
+    return [_process_file(file_path, index, stride, filters, reader) for file_path in chunk]
+
+
+def _iter_frames(
+    files: Iterable[Path],
+    jobs: int = 1,
+    chunksize: int = 16,
+    index: str = "-1",
+    stride: int = 1,
+    filters: Optional[Dict[str, Optional[float]]] = None,
+    reader: str = "fast",
+) -> Iterator[Tuple[Path, Optional[Dict[str, Any]]]]:
+    """
+    按输入顺序逐个文件产出帧数组批次。jobs > 1 时在进程池中按块解析，
+    结果按提交顺序取回以保证输出可复现。
+    """
+    return imap_chunks(_process_chunk, files, jobs, chunksize, index, stride, filters, reader)
+
+
+def _dedup_frames(
+    frame_iter: Iterator[Tuple[Path, Optional[Dict[str, Any]]]], dedup: FrameDeduplicator
+) -> Iterator[Tuple[Path, Optional[Dict[str, Any]]]]:
+    """在主进程中按输出顺序去重，保证结果与 -j 无关"""
+    for file_path, batch in frame_iter:
+        if batch is not None and len(batch["energies"]):
+            batch = _take(batch, dedup.filter(batch))
+        yield file_path, batch
+
+
+def _format_frames(file_path: Path, batch: Dict[str, Any]) -> Optional[str]:
+    """先在内存中序列化整个文件的结构再一次写入，保证输出中只有完整的帧；失败时返回 None"""
+    try:
+        return format_extxyz(batch)
+    except Exception as exc:
+        typer.echo(f"写出失败 {file_path}: {exc}", err=True)
+        return None
+
+
+def _write_batches(
+    append: Callable[[Path, Dict[str, Any]], int],
+    frame_iter: Iterator[Tuple[Path, Optional[Dict[str, Any]]]],
+    nfiles: Optional[int],
+) -> int:
+    """把帧数组批次直接交给列式/分片写出器，不经过单一文本输出"""
+    nframes = 0
+    with typer.progressbar(frame_iter, length=nfiles, label="处理中") as progress:
+        for file_path, batch in progress:
+            if batch is not None and len(batch["energies"]):
+                nframes += append(file_path, batch)
+    return nframes
+
+
+def _manifest_path(output: Path) -> Path:
+    return output.with_name(output.name + ".manifest.json")
+
+
+def _file_key(file_path: Path) -> str:
+    return file_path.resolve().as_posix()
+
+
+def _sha256(file_path: Path) -> str:
+    digest = hashlib.sha256()
+    with file_path.open("rb") as f:
+        while block := f.read(HASH_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_record(file_path: Path) -> Dict[str, Any]:
+    stat = file_path.stat()
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": _sha256(file_path)}
+
+
+def _load_manifest(output: Path, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    读取增量模式的 sidecar manifest。manifest 缺失、提取参数不同或输出文件
+    已被其他程序改动（大小/mtime 与记录不符）时返回 None，需要全量重建。
+    """
+    manifest_path = _manifest_path(output)
+    if not manifest_path.is_file() or not output.is_file():
+        return None
+
+    manifest = json.loads(manifest_path.read_text())
+    if manifest.get("options") != options:
+        typer.echo("提取参数与上次不同，重建输出。")
+        return None
+    stat = output.stat()
+    if (stat.st_size, stat.st_mtime) != (manifest["output_size"], manifest["output_mtime"]):
+        typer.echo(f"{output} 与 manifest 记录不一致，重建输出。")
+        return None
+    return manifest
+
+
+def _save_manifest(output: Path, manifest: Dict[str, Any]) -> None:
+    stat = output.stat()
+    manifest.update(output_size=stat.st_size, output_mtime=stat.st_mtime)
+    manifest_path = _manifest_path(output)
+    tmp_path = manifest_path.with_name(manifest_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp_path, manifest_path)
+
+
+def _diff_manifest(files: List[Path], entries: Dict[str, Any]) -> Tuple[List[Path], List[str]]:
+    """
+    返回需要解析的文件和内容已变化的已收录文件。大小与 mtime 都未变的文件直接跳过；
+    只有 mtime 变化而内容 hash 相同的文件仅更新记录，不重新解析。
+    """
+    pending: List[Path] = []
+    changed: List[str] = []
+    for file_path in files:
+        key = _file_key(file_path)
+        entry = entries.get(key)
+        if entry is None:
+            pending.append(file_path)
+            continue
+        stat = file_path.stat()
+        if (stat.st_size, stat.st_mtime) == (entry["size"], entry["mtime"]):
+            continue
+        sha256 = _sha256(file_path)
+        if stat.st_size == entry["size"] and sha256 == entry["sha256"]:
+            entry["mtime"] = stat.st_mtime
+            continue
+        pending.append(file_path)
+        changed.append(key)
+    return pending, changed
+
+
+def _drop_entries(output: Path, entries: Dict[str, Any], dropped: List[str]) -> None:
+    """
+    从输出中删去已变化文件的旧帧：按记录的字节区间把其余文件的帧原样拷贝到新文件，
+    不重新解析任何结构，然后原子替换输出并更新偏移。
+    """
+    tmp_path = output.with_name(output.name + ".tmp")
+    kept = sorted((e["offset"], key) for key, e in entries.items() if key not in dropped)
+    with output.open("rb") as src, tmp_path.open("wb") as dst:
+        for offset, key in kept:
+            entry = entries[key]
+            src.seek(offset)
+            entry["offset"] = dst.tell()
+            dst.write(src.read(entry["length"]))
+    os.replace(tmp_path, output)
+    for key in dropped:
+        del entries[key]
 
 
 @app.command(name="run")
 def main(
     input_path: Path = typer.Argument(..., help="输入文件或目录路径"),
-    output: Path = typer.Option(Path("output.xyz"), "-o", "--output", help="输出 XYZ 文件路径"),
+    output: Optional[Path] = typer.Option(
+        None, "-o", "--output", help="输出 XYZ 文件或目录路径，缺省为 output.xyz（列式/分片输出为 dataset 目录）"
+    ),
+    fmt: str = typer.Option("extxyz", "--format", help="输出格式: extxyz 或 columnar (可 np.memmap 的列式二进制目录)"),
     pattern: str = typer.Option("vasprun.xml", help="目录搜索时的文件名匹配模式"),
+    max_depth: Optional[int] = typer.Option(None, "--max-depth", help="目录搜索的最大深度"),
+    ignore: Optional[List[str]] = typer.Option(None, "--ignore", help="忽略匹配该 glob 的文件/目录，可重复"),
+    prune_marker: Optional[List[str]] = typer.Option(
+        None, "--prune-marker", help="目录中存在该文件（如 WAVECAR）时不再进入其子目录，可重复"
+    ),
+    scan_workers: int = typer.Option(16, "--scan-workers", min=1, help="并行扫描目录的线程数"),
+    jobs: int = typer.Option(1, "-j", "--jobs", min=1, help="并行解析的进程数"),
+    chunksize: int = typer.Option(16, "--chunksize", min=1, help="每个进程任务包含的文件数"),
+    index: str = typer.Option("-1", "--index", help="读取的离子步 (ASE index)，':' 为全部，默认最后一步"),
+    stride: int = typer.Option(1, "--stride", help="每隔 k 个离子步取一帧"),
+    fmax: Optional[float] = typer.Option(None, "--fmax", help="丢弃最大原子力大于该值的帧 (eV/Å)"),
+    emin: Optional[float] = typer.Option(None, "--emin", help="丢弃每原子能量低于该值的帧 (eV/atom)"),
+    emax: Optional[float] = typer.Option(None, "--emax", help="丢弃每原子能量高于该值的帧 (eV/atom)"),
+    smax: Optional[float] = typer.Option(None, "--smax", help="丢弃最大应力分量绝对值大于该值的帧 (GPa)"),
+    reader: str = typer.Option("fast", "--reader", help="读取方式: fast (流式 vasprun 读取器，支持 .gz/.xz) 或 ase (ase.io.read，支持其他格式)"),
+    split: Optional[str] = typer.Option(None, "--split", help="按比例划分 train,val,test，如 0.8,0.1,0.1"),
+    seed: int = typer.Option(0, "--seed", help="划分使用的随机种子"),
+    group_by_dir: bool = typer.Option(False, "--group-by-dir", help="同一目录的帧划入同一数据集，避免轨迹跨划分泄漏"),
+    shard_frames: int = typer.Option(0, "--shard-frames", help="每个分片的最大帧数，0 为不限"),
+    shard_size: float = typer.Option(0, "--shard-size", help="每个分片的最大大小 (MB)，0 为不限"),
+    dedup: bool = typer.Option(False, "--dedup", help="剔除近似重复的帧（跨文件）"),
+    dedup_etol: float = typer.Option(1e-4, "--dedup-etol", help="去重时每原子能量容差 (eV/atom)"),
+    dedup_dtol: float = typer.Option(1e-2, "--dedup-dtol", help="去重时晶格与排序原子间距的容差 (Å)"),
+    incremental: bool = typer.Option(False, "--incremental", help="只解析新增或变化的文件并追加到已有输出"),
+    rebuild: bool = typer.Option(False, "--rebuild", help="增量模式下忽略 manifest，全量重建输出"),
 ) -> None:
     """
     将 vasprun.xml 转换为/合并为 extxyz 格式。
-    支持输入单个文件或目录（递归搜索）。
+    支持输入单个文件或目录（递归搜索）。结构边读边写，中断时已写出的部分仍是合法的 extxyz；
+    未提取到任何结构时不改动已有输出。
+    vasprun.xml 截断或损坏时自动从同目录 OUTCAR 恢复已完成的离子步；没有 vasprun.xml 时可用 --pattern OUTCAR。
+    --format columnar 时输出列式数据集目录，可用 mlkit tools convert-dataset 与 extxyz 互相转换。
+    指定 --split/--shard-frames/--shard-size 时输出为目录，各划分的分片由独立线程并发写出，
+    index.json 记录每个分片的划分、帧数与大小。
+    --dedup 先按成分 + 能量指纹找候选，再用与原子顺序无关的排序原子间距确认近似重复。
+    --incremental 时在输出旁维护 <output>.manifest.json，记录每个已收录文件的路径、大小、mtime 与 sha256；
+    与 --dedup 同用时只在本次新解析的帧之间去重。
     """
-    all_atoms: List = []
-
+    files: Iterable[Path]
     if input_path.is_file():
         typer.echo(f"正在处理单文件: {input_path}")
-        all_atoms.extend(_process_file(input_path))
+        files = [input_path]
     elif input_path.is_dir():
         typer.echo(f"正在目录 '{input_path}' 中递归搜索 '{pattern}'...")
-        files = list(input_path.rglob(pattern))
-        typer.echo(f"找到 {len(files)} 个文件。")
-
-        with typer.progressbar(files, label="处理中") as progress:
-            for file_path in progress:
-                all_atoms.extend(_process_file(file_path))
+        # 边扫描边解析：文件流式交给解析进程，不等待整棵目录树遍历结束
+        files = scan_tree(input_path, pattern, max_depth, ignore or (), prune_marker or (), scan_workers)
     else:
         typer.echo(f"错误: 路径不存在 {input_path}", err=True)
         raise typer.Exit(1)
 
-    if not all_atoms:
+    if stride < 1:
+        typer.echo("错误: --stride 必须为正整数", err=True)
+        raise typer.Exit(1)
+    if reader not in ("fast", "ase"):
+        typer.echo("错误: --reader 只能为 fast 或 ase", err=True)
+        raise typer.Exit(1)
+    if fmt not in ("extxyz", "columnar"):
+        typer.echo("错误: --format 只能为 extxyz 或 columnar", err=True)
+        raise typer.Exit(1)
+    sharded = bool(split or shard_frames or shard_size)
+    if output is None:
+        output = Path("dataset" if fmt == "columnar" or sharded else "output.xyz")
+    if (fmt == "columnar" or sharded) and incremental:
+        typer.echo("错误: --incremental 目前只支持单个 extxyz 输出", err=True)
+        raise typer.Exit(1)
+    fractions = None
+    if split:
+        try:
+            fractions = [float(x) for x in split.split(",")]
+        except ValueError:
+            fractions = []
+        if not 1 <= len(fractions) <= 3 or min(fractions) < 0 or sum(fractions) <= 0:
+            typer.echo("错误: --split 应为 1~3 个非负比例，如 0.8,0.1,0.1", err=True)
+            raise typer.Exit(1)
+    filters = {"fmax": fmax, "emin": emin, "emax": emax, "smax": smax}
+    try:
+        deduplicator = FrameDeduplicator(dedup_etol, dedup_dtol) if dedup else None
+    except ValueError as e:
+        typer.echo(f"错误: {e}", err=True)
+        raise typer.Exit(1)
+
+    if sharded and output.exists() and not output.is_dir():
+        typer.echo(f"错误: {output} 已存在且不是目录", err=True)
+        raise typer.Exit(1)
+    if fmt == "columnar" and not sharded and output.exists():
+        if not output.is_dir() or not (is_dataset(output) or not any(output.iterdir())):
+            typer.echo(f"错误: {output} 已存在且不是列式数据集，拒绝覆盖", err=True)
+            raise typer.Exit(1)
+
+    if fmt == "columnar" or sharded:
+        nfiles = len(files) if isinstance(files, list) else None
+        frame_iter = _iter_frames(files, jobs, chunksize, index, stride, filters, reader)
+        if deduplicator:
+            frame_iter = _dedup_frames(frame_iter, deduplicator)
+        if sharded:
+            writer = ShardedWriter(
+                output,
+                fmt,
+                fractions,
+                seed,
+                group_by_dir,
+                shard_frames,
+                int(shard_size * 1024**2),
+                root=input_path if input_path.is_dir() else input_path.parent,
+            )
+            created = writer.created
+            try:
+                nframes = _write_batches(writer.append, frame_iter, nfiles)
+            finally:
+                shards = writer.close()["shards"]
+        else:
+            with DatasetWriter(output) as dataset:
+                nframes = _write_batches(lambda _, batch: dataset.append(batch), frame_iter, nfiles)
+            created = dataset.created
+        if deduplicator:
+            typer.echo(f"去重剔除 {deduplicator.nremoved} 个结构。")
+        if not nframes:
+            # 只删除本次新建的目录；写入已有目录时保留为 0 帧的数据集/索引
+            if created:
+                shutil.rmtree(output)
+            typer.echo("警告: 未提取到任何结构数据。", err=True)
+            raise typer.Exit(1)
+        if sharded:
+            for shard in shards:
+                typer.echo(f"  {shard['path']}: {shard['nframes']} 帧")
+        typer.echo(f"已写入 {nframes} 个结构到 {output}。")
+        typer.echo("完成。")
+        return
+
+    options = {"index": index, "stride": stride, "reader": reader, **filters}
+    if dedup:
+        options.update(dedup_etol=dedup_etol, dedup_dtol=dedup_dtol)
+
+    manifest = _load_manifest(output, options) if incremental and not rebuild else None
+    if manifest is None:
+        manifest = {"options": options, "files": {}}
+        mode = "w"
+    else:
+        mode = "a"
+    entries = manifest["files"]
+
+    if incremental:
+        files = list(files)
+    if incremental and entries:
+        files, changed = _diff_manifest(files, entries)
+        typer.echo(f"增量模式: {len(files) - len(changed)} 个新文件，{len(changed)} 个已变化文件。")
+        if changed:
+            _drop_entries(output, entries, changed)
+        if not files:
+            _save_manifest(output, manifest)
+            typer.echo("没有需要解析的文件。完成。")
+            return
+    records = {_file_key(file_path): _file_record(file_path) for file_path in files} if incremental else {}
+
+    nframes = 0
+    frame_iter = _iter_frames(files, jobs, chunksize, index, stride, filters, reader)
+    if deduplicator:
+        frame_iter = _dedup_frames(frame_iter, deduplicator)
+    # 重写模式下直到第一帧序列化成功才打开 (截断) 输出，未提取到结构时已有输出保持不变
+    f = output.open("a") if mode == "a" else None
+    try:
+        with typer.progressbar(frame_iter, length=len(files) if incremental else None, label="处理中") as progress:
+            for file_path, batch in progress:
+                if batch is None:
+                    continue
+                text = _format_frames(file_path, batch) if len(batch["energies"]) else ""
+                if text is None:
+                    continue
+                if f is None and text:
+                    f = output.open("w")
+                offset = f.tell() if f is not None else 0
+                if text:
+                    f.write(text)
+                    f.flush()
+                written = len(batch["energies"])
+                nframes += written
+                if incremental:
+                    key = _file_key(file_path)
+                    entries[key] = {**records[key], "nframes": written, "offset": offset, "length": f.tell() - offset if f is not None else 0}
+    finally:
+        if f is not None:
+            f.close()
+
+    if deduplicator:
+        typer.echo(f"去重剔除 {deduplicator.nremoved} 个结构。")
+    total = sum(e["nframes"] for e in entries.values()) if incremental else nframes
+    if not total:
+        if mode == "a":
+            # 追加到已有输出：文件不是本次创建的，保留并更新 manifest
+            _save_manifest(output, manifest)
         typer.echo("警告: 未提取到任何结构数据。", err=True)
         raise typer.Exit(1)
 
-    typer.echo(f"正在写入 {len(all_atoms)} 个结构到 {output}...")
-    write_extxyz(output, all_atoms)
+    if incremental:
+        _save_manifest(output, manifest)
+        typer.echo(f"已追加 {nframes} 个结构到 {output}，共 {total} 个。")
+    else:
+        typer.echo(f"已写入 {nframes} 个结构到 {output}。")
     typer.echo("完成。")
-
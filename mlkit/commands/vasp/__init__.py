@@ -1,7 +1,8 @@
 import typer
 
-from . import jobs
+from . import harvest, jobs
 
 app = typer.Typer(help="VASP 相关计算工具")
 
 app.add_typer(jobs.app, name="jobs")
+app.command(name="harvest")(harvest.main)
@@ -0,0 +1,186 @@
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import typer
+from mlkit.core.vasprun import is_finished
+from mlkit.core.walk import scan_tree
+
+app = typer.Typer(help="汇总已完成 section 的 VASP 结果")
+
+COLUMNS = [
+    "path",
+    "vasprun_mtime",
+    "outcar_mtime",
+    "formula",
+    "natoms",
+    "energy",
+    "energy_per_atom",
+    "max_force",
+    "forces",
+    "stress",
+    "band_gap",
+    "is_direct_gap",
+    "elapsed_time",
+    "cpu_time",
+    "converged_electronic",
+    "converged_ionic",
+]
+
+TAIL_BYTES = 16384
+
+
+def _read_outcar_timings(outcar: Path) -> Tuple[Optional[float], Optional[float]]:
+    """只读取 OUTCAR 末尾，提取 Elapsed time 与 Total CPU time"""
+    size = outcar.stat().st_size
+    with outcar.open("rb") as f:
+        f.seek(max(0, size - TAIL_BYTES))
+        tail = f.read().decode(errors="ignore")
+
+    elapsed = None
+    cpu = None
+    for line in tail.splitlines():
+        if "Elapsed time (sec):" in line:
+            elapsed = float(line.split(":")[-1])
+        elif "Total CPU time used (sec):" in line:
+            cpu = float(line.split(":")[-1])
+    return elapsed, cpu
+
+
+def _parse_section(directory: str) -> Dict[str, Any]:
+    """解析单个 section 目录，在子进程中运行"""
+    from pymatgen.io.vasp.outputs import Vasprun
+
+    section = Path(directory)
+    vasprun_path = section / "vasprun.xml"
+    outcar_path = section / "OUTCAR"
+
+    vasprun = Vasprun(
+        vasprun_path,
+        parse_dos=False,
+        parse_eigen=True,
+        parse_projected_eigen=False,
+        parse_potcar_file=False,
+    )
+    last_step = vasprun.ionic_steps[-1]
+    forces = np.array(last_step.get("forces", []))
+    natoms = len(vasprun.final_structure)
+
+    try:
+        band_gap, _, _, is_direct = vasprun.eigenvalue_band_properties
+    except Exception:
+        band_gap, is_direct = None, None
+
+    elapsed, cpu = None, None
+    outcar_mtime = None
+    if outcar_path.is_file():
+        outcar_mtime = outcar_path.stat().st_mtime
+        elapsed, cpu = _read_outcar_timings(outcar_path)
+
+    energy = float(vasprun.final_energy)
+    return {
+        "path": directory,
+        "vasprun_mtime": vasprun_path.stat().st_mtime,
+        "outcar_mtime": outcar_mtime,
+        "formula": vasprun.final_structure.composition.reduced_formula,
+        "natoms": natoms,
+        "energy": energy,
+        "energy_per_atom": energy / natoms,
+        "max_force": float(np.linalg.norm(forces, axis=1).max()) if forces.size else None,
+        "forces": json.dumps(forces.tolist()),
+        "stress": json.dumps(np.asarray(last_step.get("stress", [])).tolist()),
+        "band_gap": None if band_gap is None else float(band_gap),
+        "is_direct_gap": None if is_direct is None else bool(is_direct),
+        "elapsed_time": elapsed,
+        "cpu_time": cpu,
+        "converged_electronic": bool(vasprun.converged_electronic),
+        "converged_ionic": bool(vasprun.converged_ionic),
+    }
+
+
+def _open_store(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS results ("
+        "path TEXT PRIMARY KEY, vasprun_mtime REAL, outcar_mtime REAL, formula TEXT, "
+        "natoms INTEGER, energy REAL, energy_per_atom REAL, max_force REAL, forces TEXT, "
+        "stress TEXT, band_gap REAL, is_direct_gap INTEGER, elapsed_time REAL, "
+        "cpu_time REAL, converged_electronic INTEGER, converged_ionic INTEGER)"
+    )
+    return conn
+
+
+def _load_mtimes(conn: sqlite3.Connection) -> Dict[str, Tuple[float, Optional[float]]]:
+    rows = conn.execute("SELECT path, vasprun_mtime, outcar_mtime FROM results")
+    return {path: (vasprun_mtime, outcar_mtime) for path, vasprun_mtime, outcar_mtime in rows}
+
+
+def _find_pending(
+    work_dir: Path, known: Dict[str, Tuple[float, Optional[float]]]
+) -> Tuple[List[str], int]:
+    """返回需要(重新)解析的 section 目录，以及因 mtime 未变而跳过的数量"""
+    pending: List[str] = []
+    skipped = 0
+    for vasprun in scan_tree(work_dir, "vasprun.xml"):
+        if not is_finished(vasprun):
+            continue
+        section = vasprun.parent
+        outcar = section / "OUTCAR"
+        mtimes = (
+            vasprun.stat().st_mtime,
+            outcar.stat().st_mtime if outcar.is_file() else None,
+        )
+        if known.get(section.relative_to(work_dir).as_posix()) == mtimes:
+            skipped += 1
+            continue
+        pending.append(str(section))
+    return pending, skipped
+
+
+@app.command(name="main")
+def main(
+    work_dir: Path = typer.Argument(Path("."), help="要汇总的工作目录"),
+    output: Path = typer.Option(Path("harvest.db"), "-o", "--output", help="输出 SQLite 数据库路径"),
+    jobs: int = typer.Option(os.cpu_count() or 1, "-j", "--jobs", help="并行解析的进程数"),
+) -> None:
+    """
+    递归查找已完成的 vasprun.xml，并行解析能量、力、应力、带隙、耗时与收敛标志，
+    写入单个 SQLite 表 results。mtime 未变的目录自动跳过。
+    """
+    if not work_dir.is_dir():
+        typer.echo(f"错误: 目录不存在 {work_dir}", err=True)
+        raise typer.Exit(1)
+
+    conn = _open_store(output)
+    pending, skipped = _find_pending(work_dir, _load_mtimes(conn))
+    typer.echo(f"待解析 {len(pending)} 个目录，跳过未变化的 {skipped} 个。")
+
+    placeholders = ", ".join("?" for _ in COLUMNS)
+    sql = f"INSERT OR REPLACE INTO results ({', '.join(COLUMNS)}) VALUES ({placeholders})"
+    failed = 0
+    written = 0
+    with ProcessPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = {
+            pool.submit(_parse_section, d): Path(d).relative_to(work_dir).as_posix() for d in pending
+        }
+        with typer.progressbar(as_completed(futures), length=len(futures), label="解析中") as progress:
+            for future in progress:
+                try:
+                    row = future.result()
+                except Exception as exc:
+                    failed += 1
+                    typer.echo(f"解析失败 {futures[future]}: {exc}", err=True)
+                    continue
+                row["path"] = futures[future]
+                conn.execute(sql, [row[c] for c in COLUMNS])
+                written += 1
+                if written % 100 == 0:
+                    conn.commit()
+    conn.commit()
+    conn.close()
+
+    typer.echo(f"完成。成功 {written} 个，失败 {failed} 个，结果写入 {output}")
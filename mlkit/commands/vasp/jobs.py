@@ -1,12 +1,17 @@
+import inspect
+import io
 import math
 import os
 import shutil
 from functools import wraps
 from pathlib import Path
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import typer
+from mlkit.core.remote import RemoteHost
 from mlkit.core.shell import run_cmd
+from mlkit.core.vasprun import read_forces
 from pymatgen.core import Structure
 from pymatgen.io.vasp.inputs import Incar, Kpoints
 from pymatgen.symmetry.kpath import KPathSeek
@@ -18,10 +23,15 @@ app = typer.Typer(help="VASP 作业准备与提交工具")
 
 
 class Job:
-    def __init__(self) -> None:
+    def __init__(self, plan: bool = False) -> None:
+        # plan 模式下所有写操作和提交只记录到 planned_ops，不触碰磁盘
+        self.plan = plan
+        self.planned_ops: List[Tuple[str, str, int]] = []
+        self._planned_bytes: Dict[str, int] = {}
         self.config: Dict[str, Any] = self._load_config()
         self.work_dir: Path = self._resolve_work_dir()
-        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.remote: Optional[RemoteHost] = self._resolve_remote()
+        self._mkdir(self.work_dir)
         self._write_merged_config()
 
     def _load_config(self) -> Dict[str, Any]:
@@ -54,10 +64,56 @@ class Job:
         work_dir_cfg = global_cfg.get("work_dir")
         return Path(work_dir_cfg) if work_dir_cfg else Path.cwd()
 
+    def _resolve_remote(self) -> Optional[RemoteHost]:
+        global_cfg = self.config.get("global") or {}
+        remote_cfg = global_cfg.get("remote")
+        if not remote_cfg:
+            return None
+        return RemoteHost.from_config(remote_cfg)
+
+    def _mkdir(self, path: Path) -> None:
+        if self.plan:
+            self.planned_ops.append(("mkdir", str(path), 0))
+            return
+        path.mkdir(parents=True, exist_ok=True)
+
+    def _emit(self, target: Path, content: str) -> None:
+        if self.plan:
+            size = len(content.encode("utf-8"))
+            self._planned_bytes[str(target)] = size
+            self.planned_ops.append(("write", str(target), size))
+            return
+        target.write_text(content, encoding="utf-8")
+
+    def _copy(self, src: Path, dst: Path) -> None:
+        if self.plan:
+            size = self._planned_bytes.get(str(src)) or (src.stat().st_size if src.is_file() else 0)
+            self.planned_ops.append(("copy", f"{src} -> {dst}", size))
+            return
+        if src.is_dir():
+            if dst.exists():
+                shutil.rmtree(dst)
+            shutil.copytree(src, dst)
+        else:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(src, dst)
+
+    def report_plan(self) -> None:
+        counts: Dict[str, int] = {}
+        total_bytes = 0
+        typer.echo("计划执行的操作（未写入磁盘）:")
+        for op, target, size in self.planned_ops:
+            counts[op] = counts.get(op, 0) + 1
+            total_bytes += size
+            typer.echo(f"  {op:<6} {target}" + (f"  ({size} B)" if size else ""))
+        summary = ", ".join(f"{op} {n}" for op, n in counts.items())
+        typer.echo(f"合计: {summary}; 共 {total_bytes} 字节")
+
     def _write_merged_config(self) -> None:
         cfg_path = self.work_dir / "vasp_config.yaml"
-        with cfg_path.open("w", encoding="utf-8") as f:
-            yaml.dump(self.config, f)
+        buffer = io.StringIO()
+        yaml.dump(self.config, buffer)
+        self._emit(cfg_path, buffer.getvalue())
 
     def _calculate_grid_dimensions(self, bnorm: tuple[float, float, float], kpr: float):
         b1, b2, b3 = bnorm
@@ -66,10 +122,11 @@ class Job:
         nkpz = max(1, math.floor(b3 / kpr / 2 / math.pi))
         return nkpx, nkpy, nkpz
 
-    def _write_poscar(self, poscar: Union[Path, str], cwd: Path) -> None:
+    def _write_poscar(self, poscar: Union[Path, str], cwd: Path) -> Structure:
         target = cwd / "POSCAR"
         structure = Structure.from_file(poscar)
-        structure.to_file(target)
+        self._emit(target, structure.to(fmt="poscar"))
+        return structure
 
     def _write_incar(self, incar: Union[Path, str, Dict[str, Any]], cwd: Path) -> None:
         target = cwd / "INCAR"
@@ -77,37 +134,35 @@ class Job:
             incar_obj = Incar.from_dict(incar)
         else:
             incar_obj = Incar.from_file(incar)
-        incar_obj.write_file(target)
+        self._emit(target, str(incar_obj))
 
     def _write_potcar(self, potcar: Union[Path, str], cwd: Path) -> None:
         target = cwd / "POTCAR"
         potcar_text = Path(potcar).read_text()
-        target.write_text(potcar_text)
+        self._emit(target, potcar_text)
 
-    def _write_kpoints(self, kpoints: Union[str, float, int, Path], cwd: Path, poscar: Path) -> None:
+    def _write_kpoints(self, kpoints: Union[str, float, int, Path], cwd: Path, structure: Structure) -> None:
         target = cwd / "KPOINTS"
 
         if isinstance(kpoints, (float, int)):
-            structure = Structure.from_file(poscar)
             bnorm = structure.lattice.reciprocal_lattice.abc
             grid = self._calculate_grid_dimensions(bnorm, float(kpoints))
             kp = Kpoints.gamma_automatic(grid)
-            kp.write_file(target)
+            self._emit(target, str(kp))
             return
 
         if isinstance(kpoints, str) and kpoints == "line":
-            structure = Structure.from_file(poscar)
             kpath = KPathSeek(structure, symprec=1e-5)
             kpts, labels = kpath.get_kpoints(line_density=30, coords_are_cartesian=True)
             kp = Kpoints(comment="High-symmetry line path from Seek-path")
             kp.kpts = kpts
             kp.kpts_labels = labels
             kp.style = Kpoints.supported_modes.Line_mode
-            kp.write_file(target)
+            self._emit(target, str(kp))
             return
 
         kpoints_obj = Kpoints.from_file(kpoints)
-        kpoints_obj.write_file(target)
+        self._emit(target, str(kpoints_obj))
 
     def _write_jobscript(self, jobscript: Union[Path, str], cwd: Path) -> None:
         target = cwd / "jobscript.sh"
@@ -115,7 +170,7 @@ class Job:
             content = jobscript.read_text()
         else:
             content = jobscript
-        target.write_text(content)
+        self._emit(target, content)
 
     def _resolve_cfg_value(self, arg: Optional[Union[Path, str, float, int, Dict[str, Any]]], section: str, key: str):
         if arg is not None:
@@ -141,15 +196,16 @@ class Job:
                 typer.echo(f"Warning: Source '{src_path}' 不存在，跳过复制。", err=True)
                 continue
 
-            if src_path.is_dir():
-                if dst_path.exists():
-                    shutil.rmtree(dst_path)
-                shutil.copytree(src_path, dst_path)
-            else:
-                dst_path.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src_path, dst_path)
+            self._copy(src_path, dst_path)
 
     def _submit(self, cwd: Path) -> None:
+        if self.remote is not None:
+            self._submit_remote([cwd])
+            return
+        if self.plan:
+            self.planned_ops.append(("qsub", str(cwd), 0))
+            return
+
         pid_file = cwd / "qsub.pid"
         if pid_file.is_file():
             old_pid = pid_file.read_text().strip()
@@ -163,6 +219,38 @@ class Job:
             pid_file.write_text(new_pid)
             typer.echo(f"已提交作业 {new_pid}，PID 保存到 {pid_file}")
 
+    def _submit_remote(self, cwds: List[Path]) -> None:
+        assert self.remote is not None
+        rel_paths = [cwd.relative_to(self.work_dir) for cwd in cwds]
+        if self.plan:
+            self.planned_ops.append(("rsync", " ".join(p.as_posix() for p in rel_paths), 0))
+            for rel_path in rel_paths:
+                self.planned_ops.append(("qsub", f"{self.remote.host}:{self.remote.remote_path(rel_path)}", 0))
+            return
+        self.remote.push(self.work_dir, rel_paths)
+
+        for cwd, rel_path in zip(cwds, rel_paths):
+            remote_cwd = self.remote.remote_path(rel_path)
+            pid_file = cwd / "qsub.pid"
+            if pid_file.is_file():
+                old_pid = pid_file.read_text().strip()
+                if old_pid:
+                    typer.echo(f"发现旧作业 {old_pid}，尝试取消...")
+                    self.remote.run(["qdel", old_pid], cwd=remote_cwd, check=False)
+
+            result = self.remote.run(["qsub", "jobscript.sh"], cwd=remote_cwd)
+            new_pid = (result.stdout or "").strip()
+            if new_pid:
+                pid_file.write_text(new_pid)
+                typer.echo(f"已在 {self.remote.host} 提交作业 {new_pid}，PID 保存到 {pid_file}")
+
+    def _submit_many(self, cwds: List[Path]) -> None:
+        if self.remote is not None:
+            self._submit_remote(cwds)
+            return
+        for cwd in cwds:
+            self._submit(cwd)
+
     def _prepare_job(
         self,
         section: str,
@@ -173,11 +261,11 @@ class Job:
         jobscript: Optional[Union[Path, str]],
     ) -> Path:
         cwd = self.work_dir / section
-        cwd.mkdir(parents=True, exist_ok=True)
+        self._mkdir(cwd)
         self._handle_cp(section, cwd)
 
         poscar_path = self._resolve_cfg_value(poscar, section, "poscar")
-        self._write_poscar(Path(poscar_path), cwd)
+        structure = self._write_poscar(Path(poscar_path), cwd)
 
         incar_path = self._resolve_cfg_value(incar, section, "incar")
         self._write_incar(incar_path, cwd)
@@ -186,7 +274,7 @@ class Job:
         self._write_potcar(Path(potcar_path), cwd)
 
         kpoints_val = self._resolve_cfg_value(kpoints, section, "kpoints")
-        self._write_kpoints(kpoints_val, cwd, cwd / "POSCAR")
+        self._write_kpoints(kpoints_val, cwd, structure)
 
         jobscript_val = self._resolve_cfg_value(jobscript, section, "jobscript")
         self._write_jobscript(jobscript_val, cwd)
@@ -203,7 +291,7 @@ class Job:
         yes: bool,
     ) -> None:
         cwd = self._prepare_job(section, poscar, incar, potcar, kpoints, jobscript)
-        if yes or typer.confirm("提交作业？"):
+        if yes or self.plan or typer.confirm("提交作业？"):
             self._submit(cwd)
 
     # command entrypoints
@@ -321,6 +409,89 @@ class Job:
 
         self._make_command("fc2", poscar, incar, potcar, kpoints, jobscript, yes)
 
+    def fc2_displace(
+        self,
+        dim: List[int] = typer.Option(None, "--dim", help="超胞尺寸 (x y z)，缺省用配置 [fc2] dim"),
+        distance: float = typer.Option(0.01, "--distance", help="位移大小 (Angstrom)"),
+        poscar: Optional[Path] = typer.Option(None, "--poscar", help="POSCAR 路径，缺省用配置"),
+        yes: bool = typer.Option(False, "--yes", "-y", help="无需确认直接提交"),
+    ) -> None:
+        """用 phonopy API 生成 fc2 位移，每个位移一个目录并作为独立作业并行提交"""
+        from phonopy import Phonopy
+        from phonopy.interface.calculator import read_crystal_structure
+        from phonopy.interface.vasp import get_vasp_structure_lines
+
+        section = "fc2"
+        supercell_dim = list(dim) if dim else list(self._resolve_cfg_value(None, section, "dim"))
+        if len(supercell_dim) == 1:
+            supercell_dim = supercell_dim * 3
+        if len(supercell_dim) != 3:
+            typer.echo("错误: --dim 必须是 1 个或 3 个整数", err=True)
+            raise typer.Exit(1)
+
+        cwd = self.work_dir / section
+        self._mkdir(cwd)
+        self._handle_cp(section, cwd)
+        poscar_path = Path(self._resolve_cfg_value(poscar, section, "poscar"))
+        self._write_poscar(poscar_path, cwd)
+
+        unitcell, _ = read_crystal_structure(str(poscar_path), interface_mode="vasp")
+        phonon = Phonopy(unitcell, supercell_matrix=np.diag(supercell_dim), primitive_matrix="auto")
+        phonon.generate_displacements(distance=distance)
+        if self.plan:
+            self.planned_ops.append(("write", str(cwd / "phonopy_disp.yaml"), 0))
+        else:
+            phonon.save(filename=str(cwd / "phonopy_disp.yaml"))
+        self._emit(cwd / "SPOSCAR", "\n".join(get_vasp_structure_lines(phonon.supercell)))
+
+        # 所有位移超胞晶格相同，公共输入只生成一次再复制
+        sposcar = Structure(phonon.supercell.cell, phonon.supercell.symbols, phonon.supercell.scaled_positions)
+        self._write_incar(self._resolve_cfg_value(None, section, "incar"), cwd)
+        self._write_potcar(Path(self._resolve_cfg_value(None, section, "potcar")), cwd)
+        self._write_kpoints(self._resolve_cfg_value(None, section, "kpoints"), cwd, sposcar)
+        self._write_jobscript(self._resolve_cfg_value(None, section, "disp_jobscript"), cwd)
+
+        disp_dirs = []
+        supercells = phonon.supercells_with_displacements
+        width = max(3, len(str(len(supercells))))
+        for index, supercell in enumerate(supercells, start=1):
+            disp_dir = cwd / f"disp-{index:0{width}d}"
+            self._mkdir(disp_dir)
+            self._emit(disp_dir / "POSCAR", "\n".join(get_vasp_structure_lines(supercell)))
+            for name in ("INCAR", "POTCAR", "KPOINTS", "jobscript.sh"):
+                self._copy(cwd / name, disp_dir / name)
+            disp_dirs.append(disp_dir)
+
+        typer.echo(f"已生成 {len(disp_dirs)} 个位移目录于 {cwd}")
+        if yes or self.plan or typer.confirm(f"提交 {len(disp_dirs)} 个位移作业？"):
+            self._submit_many(disp_dirs)
+
+    def fc2_collect(self) -> None:
+        """读取各位移目录的 forces，写出 FORCE_SETS 与 FORCE_CONSTANTS"""
+        import phonopy
+        from phonopy.file_IO import write_FORCE_CONSTANTS, write_FORCE_SETS
+
+        cwd = self.work_dir / "fc2"
+        disp_yaml = cwd / "phonopy_disp.yaml"
+        if not disp_yaml.is_file():
+            typer.echo(f"错误: 找不到 {disp_yaml}，请先运行 fc2-displace", err=True)
+            raise typer.Exit(1)
+
+        phonon = phonopy.load(str(disp_yaml), produce_fc=False, log_level=0)
+        ndisp = len(phonon.supercells_with_displacements)
+        width = max(3, len(str(ndisp)))
+        vaspruns = [cwd / f"disp-{i:0{width}d}" / "vasprun.xml" for i in range(1, ndisp + 1)]
+        missing = [v.parent.name for v in vaspruns if not v.is_file()]
+        if missing:
+            typer.echo(f"错误: {len(missing)} 个位移尚未完成: {' '.join(missing)}", err=True)
+            raise typer.Exit(1)
+
+        phonon.forces = np.array([read_forces(v) for v in vaspruns])
+        write_FORCE_SETS(phonon.dataset, filename=str(cwd / "FORCE_SETS"))
+        phonon.produce_force_constants()
+        write_FORCE_CONSTANTS(phonon.force_constants, filename=str(cwd / "FORCE_CONSTANTS"))
+        typer.echo(f"已写出 {cwd / 'FORCE_SETS'} 与 {cwd / 'FORCE_CONSTANTS'}")
+
     def batch(
         self,
         poscar: Optional[Path] = typer.Option(None, "--poscar", help="POSCAR 路径，缺省用配置"),
@@ -340,19 +511,70 @@ class Job:
 
         self._make_command("batch", poscar, incar, potcar, kpoints, jobscript, yes)
 
+    def submit(
+        self,
+        sections: List[str] = typer.Argument(..., help="已准备好的 section 名称，可多个"),
+    ) -> None:
+        """批量提交已准备好的 section；配置了 global.remote 时一次 rsync 后经同一 SSH 连接提交"""
+
+        cwds = []
+        for section in sections:
+            cwd = self.work_dir / section
+            if not (cwd / "jobscript.sh").is_file():
+                typer.echo(f"错误: {cwd} 中没有 jobscript.sh，请先准备该 section", err=True)
+                raise typer.Exit(1)
+            cwds.append(cwd)
 
-def _create_lazy_command(method_name: str):
+        self._submit_many(cwds)
+
+    def status(
+        self,
+        sections: List[str] = typer.Argument(..., help="section 名称，可多个"),
+    ) -> None:
+        """根据 qsub.pid 一次性查询多个 section 的作业状态"""
+
+        pids = []
+        for section in sections:
+            pid_file = self.work_dir / section / "qsub.pid"
+            if pid_file.is_file() and pid_file.read_text().strip():
+                pids.append(pid_file.read_text().strip())
+            else:
+                typer.echo(f"Warning: {section} 没有 qsub.pid，跳过。", err=True)
+        if not pids:
+            return
+
+        if self.remote is not None:
+            result = self.remote.run(["qstat", *pids], check=False)
+        else:
+            result = run_cmd(["qstat", *pids], check=False)
+        if result.stdout:
+            typer.echo(result.stdout.rstrip())
+        if result.stderr:
+            typer.echo(result.stderr.rstrip(), err=True)
+
+
+def _create_lazy_command(method_name: str, plannable: bool = True):
     method = getattr(Job, method_name)
 
     @wraps(method)
     def wrapper(*args, **kwargs):
-        instance = Job()
-        return getattr(instance, method_name)(*args, **kwargs)
-
-    import inspect
+        plan = kwargs.pop("plan", False)
+        instance = Job(plan=plan)
+        try:
+            result = getattr(instance, method_name)(*args, **kwargs)
+        finally:
+            # 命令结束时关闭复用的 SSH 主连接，不留下后台 ssh 进程
+            if instance.remote is not None:
+                instance.remote.close()
+        if plan:
+            instance.report_plan()
+        return result
 
     sig = inspect.signature(method)
     params = [p for p in sig.parameters.values() if p.name != "self"]
+    if plannable:
+        plan_option = typer.Option(False, "--plan", help="只解析输入并报告将执行的写入与提交，不触碰磁盘")
+        params.append(inspect.Parameter("plan", inspect.Parameter.KEYWORD_ONLY, default=plan_option, annotation=bool))
     wrapper.__signature__ = sig.replace(parameters=params)  # type: ignore[attr-defined]
     return wrapper
 
@@ -363,5 +585,9 @@ app.command(name="static")(_create_lazy_command("static"))
 app.command(name="dos")(_create_lazy_command("dos"))
 app.command(name="band")(_create_lazy_command("band"))
 app.command(name="fc2")(_create_lazy_command("fc2"))
+app.command(name="fc2-displace")(_create_lazy_command("fc2_displace"))
+app.command(name="fc2-collect")(_create_lazy_command("fc2_collect", plannable=False))
 app.command(name="batch")(_create_lazy_command("batch"))
+app.command(name="submit")(_create_lazy_command("submit"))
+app.command(name="status")(_create_lazy_command("status", plannable=False))
 
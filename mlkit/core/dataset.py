@@ -0,0 +1,380 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import IO, Any, Deque, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from ase.constraints import FixAtoms
+from ase.data import atomic_numbers, chemical_symbols
+from ase.stress import voigt_6_to_full_3x3_stress
+from mlkit.core.vasprun import ATOM_KEYS
+
+# 列式数据集：每列一个小端序原始二进制文件，可直接 np.memmap。
+# 每帧一行的列与按原子拼接的列分开存放，offsets 给出每帧第一个原子在按原子列中的位置。
+FRAME_COLUMNS = {
+    "energy": ("<f8", ()),
+    "free_energy": ("<f8", ()),
+    "stress": ("<f8", (3, 3)),
+    "cell": ("<f8", (3, 3)),
+    "natoms": ("<i8", ()),
+    "offsets": ("<i8", ()),
+}
+ATOM_COLUMNS = {
+    "positions": ("<f8", (3,)),
+    "forces": ("<f8", (3,)),
+    "numbers": ("<i4", ()),
+    "move_mask": ("|b1", ()),
+}
+META_NAME = "meta.json"
+INDEX_NAME = "index.json"
+SPLIT_NAMES = ("train", "val", "test")
+FORMAT_NAME = "mlkit-columnar"
+# 批次中可选的原始离子步编号列，划分时用它而不是筛选后的位置作为帧的 key
+FRAME_INDEX_KEY = "frame_index"
+# ShardedWriter 写出的分片名，如 train-00000.xyz 或 data-00003 (列式分片目录)
+SHARD_PATTERN = re.compile(rf"(?:{'|'.join(SPLIT_NAMES)}|data)-\d{{5}}(?:\.xyz)?")
+
+# extxyz 原子行格式，与 ase.io.extxyz 一致
+ATOM_LINE = "%-2s" + " %16.8f" * 3
+# move_mask 列：ASE 对布尔列使用 " %.1s"，与前一列以空格相连
+MASK_FIELD = "  %.1s"
+
+
+def atoms_to_batch(frames: List) -> Dict[str, Any]:
+    """
+    把原子数相同的 Atoms 列表转换为与 read_trajectory 相同的帧数组批次。
+    没有计算器或缺少某个量的帧以 NaN 填充。
+    """
+    nan3 = np.full((len(frames[0]), 3), np.nan)
+    results = [a.calc.results if a.calc is not None else {} for a in frames]
+    # 与 ase.io.extxyz 相同，只有 FixAtoms 固定的原子记为不可移动
+    move_mask = np.ones(len(frames[0]), dtype=bool)
+    for constraint in frames[0].constraints:
+        if isinstance(constraint, FixAtoms):
+            move_mask[constraint.index] = False
+    return {
+        "symbols": np.array(frames[0].get_chemical_symbols()),
+        "move_mask": move_mask,
+        "cells": np.array([a.cell[:] for a in frames]),
+        "positions": np.array([a.positions for a in frames]),
+        "forces": np.array([r.get("forces", nan3) for r in results]),
+        "energies": np.array([r.get("energy", np.nan) for r in results], dtype=float),
+        "free_energies": np.array([r.get("free_energy", np.nan) for r in results], dtype=float),
+        "stresses": np.array([voigt_6_to_full_3x3_stress(r.get("stress", np.full(6, np.nan))) for r in results]),
+    }
+
+
+def format_extxyz(batch: Dict[str, Any]) -> str:
+    """
+    按 ase.io.extxyz.write_extxyz 的格式逐字节一致地序列化一个批次的所有帧。
+    有固定原子时与 ASE 相同，在坐标后写出 move_mask:L:1 列。
+    """
+    symbols = batch["symbols"]
+    natoms = len(symbols)
+    move_mask = batch.get("move_mask")
+    has_mask = move_mask is not None and not move_mask.all()
+    chunks = []
+    for i in range(len(batch["energies"])):
+        forces = batch["forces"][i]
+        stress = batch["stresses"][i]
+        has_forces = not np.isnan(forces).any()
+
+        lattice = " ".join(str(x) for x in batch["cells"][i].ravel().tolist())
+        properties = (
+            "species:S:1:pos:R:3" + (":move_mask:L:1" if has_mask else "") + (":forces:R:3" if has_forces else "")
+        )
+        comment = f'Lattice="{lattice}" Properties={properties}'
+        if not np.isnan(batch["energies"][i]):
+            comment += f" energy={batch['energies'][i].item()}"
+        if not np.isnan(stress).any():
+            comment += ' stress="' + " ".join(str(x) for x in stress.ravel().tolist()) + '"'
+        if not np.isnan(batch["free_energies"][i]):
+            comment += f" free_energy={batch['free_energies'][i].item()}"
+        comment += ' pbc="T T T"'
+
+        line = ATOM_LINE + (MASK_FIELD if has_mask else "") + (" %16.8f" * 3 if has_forces else "") + "\n"
+        table = np.empty((natoms, 4 + has_mask + 3 * has_forces), dtype=object)
+        table[:, 0] = symbols
+        table[:, 1:4] = batch["positions"][i]
+        if has_mask:
+            table[:, 4] = move_mask
+        if has_forces:
+            table[:, -3:] = forces
+        chunks.append(f"{natoms}\n{comment}\n" + (line * natoms) % tuple(table.ravel().tolist()))
+    return "".join(chunks)
+
+
+class DatasetWriter:
+    """
+    逐批追加写出列式数据集。每次 append 后刷新各列并重写 meta.json，
+    中断时已写出的帧仍可完整读取（多出的尾部字节按 meta 中的帧数忽略）。
+    """
+
+    def __init__(self, path: Union[Path, str]):
+        self.path = Path(path)
+        # 只有自己创建的目录才允许调用方在失败时整体删除
+        self.created = not self.path.exists()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.nframes = 0
+        self.natoms_total = 0
+        self._files: Dict[str, IO[bytes]] = {
+            name: (self.path / f"{name}.bin").open("wb") for name in (*FRAME_COLUMNS, *ATOM_COLUMNS)
+        }
+        # 各列已被截断，立即写出 0 帧的 meta，避免残留旧 meta 与空列不一致
+        self._write_meta()
+
+    def append(self, batch: Dict[str, Any]) -> int:
+        nframes = len(batch["energies"])
+        natoms = len(batch["symbols"])
+        numbers = np.array([atomic_numbers[s] for s in batch["symbols"]])
+        columns = {
+            "energy": batch["energies"],
+            "free_energy": batch["free_energies"],
+            "stress": batch["stresses"],
+            "cell": batch["cells"],
+            "natoms": np.full(nframes, natoms),
+            "offsets": self.natoms_total + natoms * np.arange(nframes),
+            "positions": batch["positions"],
+            "forces": batch["forces"],
+            "numbers": np.tile(numbers, nframes),
+            "move_mask": np.tile(batch.get("move_mask", np.ones(natoms, dtype=bool)), nframes),
+        }
+        for name, (dtype, _) in {**FRAME_COLUMNS, **ATOM_COLUMNS}.items():
+            self._files[name].write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+            self._files[name].flush()
+
+        self.nframes += nframes
+        self.natoms_total += nframes * natoms
+        self._write_meta()
+        return nframes
+
+    def _write_meta(self) -> None:
+        meta = {
+            "format": FORMAT_NAME,
+            "version": 1,
+            "nframes": self.nframes,
+            "natoms_total": self.natoms_total,
+            "frame_columns": {name: [dtype, list(shape)] for name, (dtype, shape) in FRAME_COLUMNS.items()},
+            "atom_columns": {name: [dtype, list(shape)] for name, (dtype, shape) in ATOM_COLUMNS.items()},
+        }
+        (self.path / META_NAME).write_text(json.dumps(meta, indent=2))
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def is_dataset(path: Union[Path, str]) -> bool:
+    return (Path(path) / META_NAME).is_file()
+
+
+def load_dataset(path: Union[Path, str]) -> Dict[str, np.ndarray]:
+    """以只读 np.memmap 打开列式数据集的所有列，不解析、不拷贝数据"""
+    path = Path(path)
+    meta = json.loads((path / META_NAME).read_text())
+    if meta.get("format") != FORMAT_NAME:
+        raise ValueError(f"{path} 不是 {FORMAT_NAME} 数据集")
+
+    data: Dict[str, np.ndarray] = {}
+    for group, length in (("frame_columns", meta["nframes"]), ("atom_columns", meta["natoms_total"])):
+        for name, (dtype, shape) in meta[group].items():
+            if not length:
+                # 空文件无法 mmap，0 帧数据集返回同 dtype 的空数组
+                data[name] = np.empty((0, *shape), dtype=dtype)
+                continue
+            data[name] = np.memmap(path / f"{name}.bin", dtype=dtype, mode="r", shape=(length, *shape))
+    return data
+
+
+def frame_batch(data: Dict[str, np.ndarray], i: int) -> Dict[str, Any]:
+    """按 offsets 随机读取第 i 帧，返回单帧批次"""
+    start = int(data["offsets"][i])
+    atoms = slice(start, start + int(data["natoms"][i]))
+    batch = {
+        "symbols": np.array([chemical_symbols[z] for z in data["numbers"][atoms]]),
+        "cells": np.asarray(data["cell"][i : i + 1]),
+        "positions": np.asarray(data["positions"][atoms])[None],
+        "forces": np.asarray(data["forces"][atoms])[None],
+        "energies": np.asarray(data["energy"][i : i + 1]),
+        "free_energies": np.asarray(data["free_energy"][i : i + 1]),
+        "stresses": np.asarray(data["stress"][i : i + 1]),
+    }
+    # 早期写出的数据集没有 move_mask 列，视为全部可移动
+    if "move_mask" in data:
+        batch["move_mask"] = np.asarray(data["move_mask"][atoms])
+    return batch
+
+
+def _frames(batch: Dict[str, Any], start: int, stop: int) -> Dict[str, Any]:
+    return {key: (val if key in ATOM_KEYS else val[start:stop]) for key, val in batch.items()}
+
+
+def split_of(key: str, seed: int, fractions: Sequence[float]) -> int:
+    """
+    由 (seed, key) 的 hash 确定性地分配数据集划分，与处理顺序、并行度无关，
+    新增数据时已有数据的归属也不会改变。
+    """
+    digest = hashlib.blake2b(f"{seed}:{key}".encode(), digest_size=8).digest()
+    u = int.from_bytes(digest, "little") / 2**64
+    return min(int(np.searchsorted(np.cumsum(fractions), u, side="right")), len(fractions) - 1)
+
+
+class _ShardStream:
+    """单个划分 (train/val/test) 的分片序列，超过帧数或字节上限时滚动到下一个分片"""
+
+    def __init__(self, root: Path, name: str, fmt: str, max_frames: int, max_bytes: int):
+        self.root = root
+        self.name = name
+        self.fmt = fmt
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.shards: List[Dict[str, Any]] = []
+        self._handle: Any = None
+
+    def _roll(self) -> None:
+        self.close()
+        shard_name = f"{self.name}-{len(self.shards):05d}" + (".xyz" if self.fmt == "extxyz" else "")
+        self._handle = (self.root / shard_name).open("w") if self.fmt == "extxyz" else DatasetWriter(self.root / shard_name)
+        self.shards.append({"split": self.name, "path": shard_name, "nframes": 0, "bytes": 0})
+
+    def _fits(self, nframes: int, nbytes: float) -> bool:
+        shard = self.shards[-1]
+        return (not self.max_frames or shard["nframes"] + nframes <= self.max_frames) and (
+            not self.max_bytes or shard["bytes"] + nbytes <= self.max_bytes
+        )
+
+    def write(self, batch: Dict[str, Any]) -> None:
+        """按帧贪心装入分片，单个文件的帧也可以跨分片；每个分片至少一帧"""
+        nframes = len(batch["energies"])
+        if self.fmt == "extxyz":
+            payloads = [format_extxyz(_frames(batch, i, i + 1)) for i in range(nframes)]
+            sizes = np.array([len(text) for text in payloads])
+        else:
+            sizes = np.full(nframes, sum(np.asarray(v).nbytes for v in batch.values()) / nframes)
+        cum = np.concatenate(([0], np.cumsum(sizes)))
+
+        start = 0
+        while start < nframes:
+            if self._handle is None or not self._fits(1, sizes[start]):
+                self._roll()
+            stop = start + 1
+            while stop < nframes and self._fits(stop + 1 - start, cum[stop + 1] - cum[start]):
+                stop += 1
+            if self.fmt == "extxyz":
+                self._handle.write("".join(payloads[start:stop]))
+                self._handle.flush()
+            else:
+                self._handle.append(_frames(batch, start, stop))
+            self.shards[-1]["nframes"] += stop - start
+            self.shards[-1]["bytes"] += int(cum[stop] - cum[start])
+            start = stop
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class ShardedWriter:
+    """
+    按划分和大小写出分片数据集。每个划分由独立的写线程负责序列化与写盘，
+    各划分之间并发写出，同一划分内保持提交顺序。结束时写出 index.json 描述所有分片。
+    划分的 key 为相对 root 的源文件路径加原始离子步编号，与筛选、去重无关。
+    """
+
+    def __init__(
+        self,
+        path: Union[Path, str],
+        fmt: str = "extxyz",
+        fractions: Optional[Sequence[float]] = None,
+        seed: int = 0,
+        group_by_dir: bool = False,
+        max_frames: int = 0,
+        max_bytes: int = 0,
+        root: Optional[Union[Path, str]] = None,
+    ):
+        self.path = Path(path)
+        self.created = not self.path.exists()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._clear_shards()
+        self.root = Path(root) if root is not None else None
+        self.fractions = [f / sum(fractions) for f in fractions] if fractions else None
+        self.seed = seed
+        self.group_by_dir = group_by_dir
+        names = SPLIT_NAMES[: len(self.fractions)] if self.fractions else ("data",)
+        self._streams = [_ShardStream(self.path, name, fmt, max_frames, max_bytes) for name in names]
+        self._pools = [ThreadPoolExecutor(max_workers=1) for _ in names]
+        self._pending: List[Deque[Future]] = [deque() for _ in names]
+        self.meta = {
+            "format": fmt,
+            "seed": seed,
+            "fractions": self.fractions,
+            "group_by_dir": group_by_dir,
+            "max_frames": max_frames,
+            "max_bytes": max_bytes,
+        }
+
+    def _clear_shards(self) -> None:
+        """删除上次运行留下的分片和 index.json，目录中其他文件不动"""
+        for entry in self.path.iterdir():
+            if not SHARD_PATTERN.fullmatch(entry.name):
+                continue
+            if entry.is_file():
+                entry.unlink()
+            elif is_dataset(entry) or all(child.suffix == ".bin" for child in entry.iterdir()):
+                shutil.rmtree(entry)
+        (self.path / INDEX_NAME).unlink(missing_ok=True)
+
+    def _source_key(self, source: Path) -> str:
+        """相对 root 的路径，数据目录整体移动或换机器后划分保持不变"""
+        if self.root is None:
+            return source.as_posix()
+        return Path(os.path.relpath(os.path.abspath(source), os.path.abspath(self.root))).as_posix()
+
+    def _submit(self, i: int, batch: Dict[str, Any]) -> None:
+        pending = self._pending[i]
+        # 限制每个写线程的积压，避免解析快于写盘时内存无限增长
+        while len(pending) >= 4:
+            pending.popleft().result()
+        pending.append(self._pools[i].submit(self._streams[i].write, batch))
+
+    def append(self, source: Path, batch: Dict[str, Any]) -> int:
+        nframes = len(batch["energies"])
+        if not self.fractions:
+            self._submit(0, batch)
+            return nframes
+
+        source_key = self._source_key(source)
+        if self.group_by_dir:
+            splits = np.full(nframes, split_of(str(Path(source_key).parent), self.seed, self.fractions))
+        else:
+            frame_ids = batch.get(FRAME_INDEX_KEY, np.arange(nframes)).tolist()
+            splits = np.array([split_of(f"{source_key}:{i}", self.seed, self.fractions) for i in frame_ids])
+        for i in np.unique(splits).tolist():
+            mask = splits == i
+            self._submit(i, {key: (val if key in ATOM_KEYS else val[mask]) for key, val in batch.items()})
+        return nframes
+
+    def close(self) -> Dict[str, Any]:
+        for pending in self._pending:
+            while pending:
+                pending.popleft().result()
+        for pool, stream in zip(self._pools, self._streams):
+            pool.shutdown()
+            stream.close()
+
+        shards = [shard for stream in self._streams for shard in stream.shards]
+        index = {**self.meta, "nframes": sum(s["nframes"] for s in shards), "shards": shards}
+        (self.path / INDEX_NAME).write_text(json.dumps(index, indent=2))
+        return index
@@ -0,0 +1,81 @@
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+
+def _pair_distances(symbols: np.ndarray, cell: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    """
+    与原子编号顺序无关的结构描述符：按元素对分组、组内升序排列的最小镜像原子间距。
+    两个结构成分相同时描述符长度相同，可直接逐元素比较。
+    """
+    _, species = np.unique(symbols, return_inverse=True)
+    frac = positions @ np.linalg.inv(cell)
+    i, j = np.triu_indices(len(symbols), 1)
+    diff = frac[i] - frac[j]
+    diff -= np.round(diff)
+    dist = np.linalg.norm(diff @ cell, axis=1)
+    lo, hi = np.minimum(species[i], species[j]), np.maximum(species[i], species[j])
+    return dist[np.lexsort((dist, hi, lo))]
+
+
+class FrameDeduplicator:
+    """
+    跨文件剔除近似重复的帧。先用成分 + 每原子能量分桶作为廉价指纹，
+    只有同成分且每原子能量差不超过 etol 的候选才计算描述符（按需计算并缓存），
+    晶格与描述符的最大逐元素差都不超过 dtol (Å) 才判为重复。
+    """
+
+    def __init__(self, etol: float = 1e-4, dtol: float = 1e-2):
+        if not etol > 0:
+            raise ValueError(f"能量容差 etol 必须为正数: {etol}")
+        if not dtol >= 0:
+            raise ValueError(f"距离容差 dtol 不能为负: {dtol}")
+        self.etol = etol
+        self.dtol = dtol
+        self.nremoved = 0
+        # (成分, 能量桶) -> 已保留帧的 [每原子能量, 晶格, 坐标, 元素, 描述符或 None]
+        self._buckets: Dict[Tuple[str, int], List[List[Any]]] = defaultdict(list)
+
+    @staticmethod
+    def _descriptor(entry: List[Any]) -> np.ndarray:
+        if entry[4] is None:
+            entry[4] = _pair_distances(entry[3], entry[1], entry[2])
+        return entry[4]
+
+    def _is_duplicate(self, key: Tuple[str, int], entry: List[Any]) -> bool:
+        composition, bucket = key
+        candidates = [
+            other
+            for b in (bucket - 1, bucket, bucket + 1)
+            for other in self._buckets.get((composition, b), ())
+            if abs(other[0] - entry[0]) <= self.etol
+        ]
+        if not candidates:
+            return False
+        cells = np.array([other[1] for other in candidates])
+        candidates = [other for other, d in zip(candidates, np.abs(cells - entry[1]).max(axis=(1, 2))) if d <= self.dtol]
+        if not candidates:
+            return False
+        descs = np.array([self._descriptor(other) for other in candidates])
+        return bool((np.abs(descs - self._descriptor(entry)).max(axis=1) <= self.dtol).any())
+
+    def filter(self, batch: Dict[str, Any]) -> np.ndarray:
+        """返回批次中需要保留的帧的布尔掩码，并把保留的帧记入指纹表"""
+        symbols = batch["symbols"]
+        composition = " ".join(f"{s}{n}" for s, n in sorted(Counter(symbols.tolist()).items()))
+        epa = batch["energies"] / len(symbols)
+        buckets = np.floor(epa / self.etol).astype(np.int64)
+
+        keep = np.ones(len(epa), dtype=bool)
+        for i, (e, b) in enumerate(zip(epa.tolist(), buckets.tolist())):
+            key = (composition, b)
+            entry = [e, batch["cells"][i], batch["positions"][i], symbols, None]
+            if self._is_duplicate(key, entry):
+                keep[i] = False
+                self.nremoved += 1
+            else:
+                # 拷贝单帧数据，指纹表不持有整个批次数组的视图
+                entry[1], entry[2] = entry[1].copy(), entry[2].copy()
+                self._buckets[key].append(entry)
+        return keep
@@ -0,0 +1,193 @@
+import mmap
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from ase.units import GPa
+
+from mlkit.core.vasprun import open_vasprun
+
+FORCE_MARKER = b"TOTAL-FORCE (eV/Angst)"
+ENERGY_MARKER = b"energy(sigma->0)"
+TOTEN_MARKER = b"TOTEN"
+CELL_MARKER = b"direct lattice vectors"
+STRESS_MARKER = b"in kB"
+BORN_MARKER = b"BORN EFFECTIVE CHARGES"
+# 只匹配带括号的总张量 (including/excluding local field effects)，不匹配 IONIC CONTRIBUTION
+DIELECTRIC_MARKER = b"MACROSCOPIC STATIC DIELECTRIC TENSOR ("
+ELASTIC_MARKER = b"TOTAL ELASTIC MODULI (kBar)"
+
+# OUTCAR 的 in kB 行顺序为 XX YY ZZ XY YZ ZX，换成 Voigt (xx yy zz yz xz xy)，与 ase.io.vasp 一致
+KB_TO_VOIGT = [0, 1, 2, 4, 5, 3]
+
+
+@contextmanager
+def _open_buffer(path: Path) -> Iterator[Any]:
+    """普通文件用 mmap 按字节偏移随机访问，压缩文件整体解压到内存"""
+    if path.suffix in (".gz", ".xz", ".bz2"):
+        with open_vasprun(path) as f:
+            yield f.read()
+        return
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        yield buf
+
+
+def _line_at(buf: Any, offset: int) -> bytes:
+    end = buf.find(b"\n", offset)
+    return buf[offset : end if end >= 0 else len(buf)]
+
+
+def _read_symbols(buf: Any, header_end: int) -> List[str]:
+    """由 POTCAR: 行（头部会重复一遍）和 ions per type 得到逐原子元素"""
+    names = []
+    pos = buf.find(b"POTCAR:", 0, header_end)
+    while pos >= 0:
+        names.append(_line_at(buf, pos).split()[2].decode().split("_")[0])
+        pos = buf.find(b"POTCAR:", pos + 1, header_end)
+    half = len(names) // 2
+    if names and len(names) % 2 == 0 and names[:half] == names[half:]:
+        names = names[:half]
+
+    counts_at = buf.find(b"ions per type =", 0, header_end)
+    if counts_at < 0 or not names:
+        raise ValueError("OUTCAR 头部缺少 POTCAR 或 ions per type 信息")
+    counts = [int(n) for n in _line_at(buf, counts_at).split(b"=")[1].split()]
+    return [name for name, count in zip(names, counts) for _ in range(count)]
+
+
+def _read_cell(buf: Any, offset: int) -> np.ndarray:
+    start = buf.find(b"\n", offset) + 1
+    rows = []
+    for _ in range(3):
+        line = _line_at(buf, start)
+        rows.append([float(x) for x in line.split()[:3]])
+        start += len(line) + 1
+    return np.array(rows)
+
+
+def _read_stress(buf: Any, offset: int) -> np.ndarray:
+    try:
+        kbar = np.array([float(x) for x in _line_at(buf, offset).split()[2:8]])[KB_TO_VOIGT]
+    except (ValueError, IndexError):
+        # 数值溢出时 VASP 会输出 ********
+        return np.full((3, 3), np.nan)
+    xx, yy, zz, yz, xz, xy = -kbar * 1e-1 * GPa
+    return np.array([[xx, xy, xz], [xy, yy, yz], [xz, yz, zz]])
+
+
+def read_outcar_trajectory(path: Union[Path, str]) -> Dict[str, Any]:
+    """
+    从 OUTCAR 中恢复所有已完成离子步的晶格、坐标、力、能量和应力，返回与
+    read_trajectory 相同的字典。不逐行解析电子步输出，而是用 find/rfind
+    在 POSITION/TOTAL-FORCE 块之间按字节偏移跳转，只解码需要的几行；
+    最后一个离子步如果还没写出 energy(sigma->0) 则视为未完成并丢弃。
+    """
+    path = Path(path)
+    cells, positions, forces, energies, free_energies, stresses = [], [], [], [], [], []
+
+    with _open_buffer(path) as buf:
+        first = buf.find(FORCE_MARKER)
+        symbols = _read_symbols(buf, first if first >= 0 else len(buf))
+        natoms = len(symbols)
+
+        cell = None
+        pos = 0
+        while True:
+            block_at = buf.find(FORCE_MARKER, pos)
+            if block_at < 0:
+                break
+            # 跳过标题行和分隔线，数据块以下一条分隔线结束
+            start = buf.find(b"\n", buf.find(b"\n", block_at) + 1) + 1
+            end = buf.find(b" ----", start)
+            energy_at = buf.find(ENERGY_MARKER, end) if end >= 0 else -1
+            next_block = buf.find(FORCE_MARKER, block_at + 1)
+            if energy_at < 0 or 0 <= next_block < energy_at:
+                break
+
+            data = np.fromstring(buf[start:end].decode(), sep=" ")
+            if data.size != natoms * 6:
+                break
+
+            cell_at = buf.rfind(CELL_MARKER, pos, block_at)
+            if cell_at >= 0:
+                cell = _read_cell(buf, cell_at)
+            if cell is None:
+                raise ValueError(f"{path} 中没有晶格信息")
+            stress_at = buf.rfind(STRESS_MARKER, pos, block_at)
+            toten_at = buf.rfind(TOTEN_MARKER, end, energy_at)
+
+            data = data.reshape(natoms, 6)
+            cells.append(cell)
+            positions.append(data[:, :3])
+            forces.append(data[:, 3:])
+            energies.append(float(_line_at(buf, energy_at).split(b"=")[-1]))
+            free_energies.append(float(_line_at(buf, toten_at).split(b"=")[1].split()[0]) if toten_at >= 0 else np.nan)
+            stresses.append(_read_stress(buf, stress_at) if stress_at >= 0 else np.full((3, 3), np.nan))
+            pos = energy_at
+
+    return {
+        "symbols": np.array(symbols),
+        "cells": np.array(cells).reshape(-1, 3, 3),
+        "positions": np.array(positions).reshape(-1, natoms, 3),
+        "forces": np.array(forces).reshape(-1, natoms, 3),
+        "energies": np.array(energies),
+        "free_energies": np.array(free_energies),
+        "stresses": np.array(stresses).reshape(-1, 3, 3),
+    }
+
+
+def _next_line(buf: Any, offset: int) -> Tuple[bytes, int]:
+    """返回 offset 处的一行及下一行的起始偏移"""
+    line = _line_at(buf, offset)
+    return line, offset + len(line) + 1
+
+
+def _last_table(buf: Any, marker: bytes, skip: int, nrows: int, ncols: int) -> Optional[np.ndarray]:
+    """从文件末尾反向查找最后一个 marker，跳过 skip 行表头后读取 nrows 行、每行最后 ncols 个数"""
+    at = buf.rfind(marker)
+    if at < 0:
+        return None
+    _, pos = _next_line(buf, at)
+    for _ in range(skip):
+        _, pos = _next_line(buf, pos)
+    rows = []
+    for _ in range(nrows):
+        line, pos = _next_line(buf, pos)
+        rows.append([float(x) for x in line.split()[-ncols:]])
+    return np.array(rows)
+
+
+def _last_born(buf: Any) -> Optional[np.ndarray]:
+    """最后一个 BORN EFFECTIVE CHARGES 块：分隔线后逐原子 "ion N" + 3 行 "i x y z" """
+    at = buf.rfind(BORN_MARKER)
+    if at < 0:
+        return None
+    _, pos = _next_line(buf, at)
+    _, pos = _next_line(buf, pos)
+    charges = []
+    while True:
+        line, pos = _next_line(buf, pos)
+        if line.split()[:1] != [b"ion"]:
+            break
+        tensor = []
+        for _ in range(3):
+            row, pos = _next_line(buf, pos)
+            tensor.append([float(x) for x in row.split()[1:4]])
+        charges.append(tensor)
+    return np.array(charges).reshape(-1, 3, 3)
+
+
+def read_outcar_lepsilon(path: Union[Path, str]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    只读取 OUTCAR 中最后一组 Born 有效电荷 (natoms, 3, 3) 与宏观静态介电张量 (3, 3)。
+    用 mmap 上的 rfind 从文件末尾向前定位，不解析其余内容；缺失的量返回 None。
+    """
+    with _open_buffer(Path(path)) as buf:
+        return _last_born(buf), _last_table(buf, DIELECTRIC_MARKER, 1, 3, 3)
+
+
+def read_outcar_elastic(path: Union[Path, str]) -> Optional[np.ndarray]:
+    """只读取 OUTCAR 中最后一个 TOTAL ELASTIC MODULI (kBar) 6x6 表，顺序与 OUTCAR 相同 (XX YY ZZ XY YZ ZX)"""
+    with _open_buffer(Path(path)) as buf:
+        return _last_table(buf, ELASTIC_MARKER, 2, 6, 6)
@@ -0,0 +1,39 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def imap_chunks(
+    func: Callable[..., List[R]],
+    items: Iterable[T],
+    jobs: int = 1,
+    chunksize: int = 16,
+    *args: Any,
+) -> Iterator[Tuple[T, R]]:
+    """
+    按输入顺序产出 (item, func 对其的结果)。func(chunk, *args) 处理一个块并按顺序返回结果列表。
+    jobs > 1 时在进程池中按块执行，最多保持 2 * jobs 个块在途，结果按提交顺序取回，
+    输入可以是边产出边消费的迭代器。jobs <= 1 时在当前进程中逐个执行。
+    """
+    if jobs <= 1:
+        for item in items:
+            yield item, func([item], *args)[0]
+        return
+
+    item_iter = iter(items)
+    in_flight: deque = deque()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            while len(in_flight) < 2 * jobs:
+                chunk = list(islice(item_iter, chunksize))
+                if not chunk:
+                    break
+                in_flight.append((chunk, pool.submit(func, chunk, *args)))
+            if not in_flight:
+                return
+            chunk, future = in_flight.popleft()
+            yield from zip(chunk, future.result())
@@ -0,0 +1,94 @@
+import shlex
+import subprocess
+from pathlib import Path, PurePosixPath
+from typing import Any, Dict, List, Optional, Sequence
+
+from mlkit.core.shell import run_cmd
+
+
+class RemoteHost:
+    """
+    通过一条持久复用的 SSH 主连接 (ControlMaster) 与远程登录节点交互。
+    所有 ssh/rsync 调用共享同一个 ControlPath，只有第一次调用需要握手。
+    """
+
+    def __init__(
+        self,
+        host: str,
+        work_dir: str,
+        ssh: str = "ssh",
+        rsync: str = "rsync",
+        control_path: str = "~/.ssh/mlkit-%C",
+        control_persist: str = "10m",
+    ) -> None:
+        self.host = host
+        self.work_dir = PurePosixPath(work_dir)
+        self.ssh = ssh
+        self.rsync = rsync
+        self.control_path = control_path
+        self.control_persist = control_persist
+        # 是否已经发起过连接；从未连接时 close 不必再启动一次 ssh
+        self._used = False
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "RemoteHost":
+        if not cfg.get("host") or not cfg.get("work_dir"):
+            raise ValueError("缺少配置: [global.remote] host / work_dir")
+        keys = ("ssh", "rsync", "control_path", "control_persist")
+        extra = {k: str(cfg[k]) for k in keys if cfg.get(k) is not None}
+        return cls(str(cfg["host"]), str(cfg["work_dir"]), **extra)
+
+    def _ssh_options(self) -> List[str]:
+        return [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={self.control_path}",
+            "-o",
+            f"ControlPersist={self.control_persist}",
+        ]
+
+    def remote_path(self, rel_path: Path) -> str:
+        return (self.work_dir / rel_path.as_posix()).as_posix()
+
+    def run(
+        self, cmd: List[str], cwd: Optional[str] = None, check: bool = True
+    ) -> subprocess.CompletedProcess:
+        """在远程节点执行命令，cwd 为远程目录"""
+        remote_cmd = shlex.join(cmd)
+        if cwd:
+            remote_cmd = f"cd {shlex.quote(cwd)} && {remote_cmd}"
+        self._used = True
+        return run_cmd([self.ssh, *self._ssh_options(), self.host, remote_cmd], check=check)
+
+    def push(self, local_root: Path, rel_paths: Sequence[Path]) -> None:
+        """用一次 rsync 把 local_root 下的多个目录同步到远程 work_dir，保留相对路径"""
+        if not rel_paths:
+            return
+        self.run(["mkdir", "-p", self.work_dir.as_posix()])
+        rsh = shlex.join([self.ssh, *self._ssh_options()])
+        run_cmd(
+            [
+                self.rsync,
+                "-az",
+                "--relative",
+                "-e",
+                rsh,
+                *[p.as_posix() for p in rel_paths],
+                f"{self.host}:{self.work_dir.as_posix()}/",
+            ],
+            cwd=str(local_root),
+        )
+
+    def close(self) -> None:
+        """关闭主连接"""
+        if not self._used:
+            return
+        self._used = False
+        run_cmd([self.ssh, *self._ssh_options(), "-O", "exit", self.host], check=False)
+
+    def __enter__(self) -> "RemoteHost":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
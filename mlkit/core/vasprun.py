@@ -0,0 +1,201 @@
+import bz2
+import gzip
+import lzma
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import IO, Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+from ase.units import GPa
+
+# 读完即可整体释放的容器标签，其子元素 (<v>, <r>) 随之释放
+CONTAINER_TAGS = {"varray", "array", "set", "calculation"}
+
+# 离子步内用不到的大块数据，读到结尾直接释放
+SKIPPED_TAGS = {"eigenvalues", "projected", "dos", "dielectricfunction", "scstep"}
+
+# 与 ase.io.vasp.read_vasp_xml 相同的单位换算，保证两种读取方式结果一致
+PSTRESS_TO_EV_A3 = 1e-22 / 1.60217733e-19
+KBAR_TO_EV_A3 = -0.1 * GPa
+
+FRAME_KEYS = ("cells", "positions", "forces", "energies", "free_energies", "stresses")
+# 每个原子一个值、所有帧共用的量；按帧切片批次时原样保留
+ATOM_KEYS = ("symbols", "move_mask")
+
+
+def open_vasprun(path: Union[Path, str]) -> IO[bytes]:
+    """按后缀透明打开 vasprun.xml / .gz / .xz / .bz2"""
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".xz":
+        return lzma.open(path, "rb")
+    if path.suffix == ".bz2":
+        return bz2.open(path, "rb")
+    return path.open("rb")
+
+
+def is_finished(path: Union[Path, str]) -> bool:
+    """vasprun.xml 以 </modeling> 结尾才认为计算已完成"""
+    path = Path(path)
+    size = path.stat().st_size
+    with path.open("rb") as f:
+        f.seek(max(0, size - 256))
+        return b"</modeling>" in f.read()
+
+
+def _varray(elem: ET.Element) -> np.ndarray:
+    text = " ".join(v.text for v in elem)
+    return np.fromstring(text, sep=" ").reshape(len(elem), -1)
+
+
+def read_forces(path: Union[Path, str]) -> np.ndarray:
+    """
+    流式读取 vasprun.xml 中最后一个离子步的 forces 块，其余标签读过即丢弃。
+    """
+    forces = None
+    with open_vasprun(path) as f:
+        for _, elem in ET.iterparse(f, events=("end",)):
+            if elem.tag == "varray" and elem.get("name") == "forces":
+                forces = _varray(elem)
+            if elem.tag in CONTAINER_TAGS:
+                elem.clear()
+
+    if forces is None:
+        raise ValueError(f"{path} 中没有 forces 数据")
+    return forces
+
+
+def _move_mask(elem: ET.Element) -> np.ndarray:
+    """
+    initialpos 中的 selective dynamics 标记转换为每原子的 move_mask。
+    与 ASE 一致，只有三个方向都固定 (F F F) 的原子视为固定，部分固定 (FixScaled) 不体现在 move_mask 中。
+    """
+    flags = np.array([v.text.split() for v in elem])
+    return ~(flags == "F").all(axis=1)
+
+
+def _grow(arr: Optional[np.ndarray], capacity: int, shape: Tuple[int, ...], fill: float) -> np.ndarray:
+    """容量翻倍扩展预分配数组，避免逐帧 append"""
+    new = np.full((capacity, *shape), fill)
+    if arr is not None:
+        new[: len(arr)] = arr
+    return new
+
+
+def read_trajectory(path: Union[Path, str]) -> Dict[str, Any]:
+    """
+    流式读取 vasprun.xml 的全部离子步，只保留晶格、元素、坐标、力、能量与应力。
+
+    返回 symbols (natoms,)、move_mask (natoms,，selective dynamics 中可移动的原子为 True) 以及按帧堆叠的 cells (n,3,3)、positions (n,natoms,3，笛卡尔)、
+    forces (n,natoms,3)、energies (n,)、free_energies (n,)、stresses (n,3,3，eV/Å^3)。
+    缺失的力与应力以 NaN 填充。能量、应力的约定与 ase.io.read 完全相同，
+    截断的文件只返回已完整写出的离子步，并置 truncated 为 True。
+    """
+    symbols = []
+    move_mask = None
+    structure = None
+    pstress = 0.0
+    nframes = 0
+    capacity = 0
+    buffers: Dict[str, Optional[np.ndarray]] = dict.fromkeys(FRAME_KEYS)
+
+    in_calc = False
+    in_scstep = False
+    truncated = False
+    step: Dict[str, Any] = {}
+
+    with open_vasprun(path) as f:
+        try:
+            for event, elem in ET.iterparse(f, events=("start", "end")):
+                tag = elem.tag
+                if event == "start":
+                    if tag == "calculation":
+                        in_calc = True
+                        step = {"de": 0.0}
+                    elif tag == "scstep":
+                        in_scstep = True
+                    elif tag == "structure" and not in_calc:
+                        structure = elem.get("name")
+                    continue
+
+                if not in_calc:
+                    if tag == "array" and elem.get("name") == "atoms":
+                        symbols = [rc[0].text.strip() for rc in elem.iter("rc")]
+                        elem.clear()
+                    elif tag == "varray" and elem.get("name") == "selective" and structure == "initialpos":
+                        move_mask = _move_mask(elem)
+                    elif tag == "i" and elem.get("name") == "PSTRESS":
+                        pstress = float(elem.text)
+                    continue
+
+                if tag == "energy":
+                    # scstep 内取最后一个电子步的 e_0 - e_fr 作为 sigma->0 修正
+                    e_fr = float(elem.find("i[@name='e_fr_energy']").text)
+                    if in_scstep:
+                        step["de"] = float(elem.find("i[@name='e_0_energy']").text) - e_fr
+                    else:
+                        step["free_energy"] = e_fr
+                elif tag == "varray":
+                    if elem.get("name") in ("basis", "positions", "forces", "stress"):
+                        step[elem.get("name")] = _varray(elem)
+                    elem.clear()
+                elif tag in SKIPPED_TAGS:
+                    in_scstep = in_scstep and tag != "scstep"
+                    elem.clear()
+                elif tag == "calculation":
+                    in_calc = False
+                    elem.clear()
+                    if "free_energy" not in step:
+                        continue
+
+                    if nframes == capacity:
+                        natoms = len(symbols)
+                        capacity = max(16, 2 * capacity)
+                        buffers["cells"] = _grow(buffers["cells"], capacity, (3, 3), 0.0)
+                        buffers["positions"] = _grow(buffers["positions"], capacity, (natoms, 3), 0.0)
+                        buffers["forces"] = _grow(buffers["forces"], capacity, (natoms, 3), np.nan)
+                        buffers["energies"] = _grow(buffers["energies"], capacity, (), 0.0)
+                        buffers["free_energies"] = _grow(buffers["free_energies"], capacity, (), 0.0)
+                        buffers["stresses"] = _grow(buffers["stresses"], capacity, (3, 3), np.nan)
+
+                    cell = step["basis"]
+                    free_energy = step["free_energy"] - pstress * PSTRESS_TO_EV_A3 * np.linalg.det(cell)
+                    buffers["cells"][nframes] = cell
+                    buffers["positions"][nframes] = step["positions"] @ cell
+                    buffers["free_energies"][nframes] = free_energy
+                    buffers["energies"][nframes] = free_energy + step["de"]
+                    if "forces" in step:
+                        buffers["forces"][nframes] = step["forces"]
+                    if "stress" in step:
+                        # 与 ASE 相同，只取上三角 (Voigt) 并对称化
+                        stress = step["stress"] * KBAR_TO_EV_A3
+                        lower = np.tril_indices(3, -1)
+                        stress[lower] = stress.T[lower]
+                        buffers["stresses"][nframes] = stress
+                    nframes += 1
+        except ET.ParseError:
+            if not nframes:
+                raise
+            truncated = True
+
+    if not symbols:
+        raise ValueError(f"{path} 中没有原子信息")
+    natoms = len(symbols)
+    empty_shapes = {
+        "cells": (3, 3),
+        "positions": (natoms, 3),
+        "forces": (natoms, 3),
+        "energies": (),
+        "free_energies": (),
+        "stresses": (3, 3),
+    }
+    trajectory: Dict[str, Any] = {
+        "symbols": np.array(symbols),
+        "move_mask": move_mask if move_mask is not None else np.ones(natoms, dtype=bool),
+        "truncated": truncated,
+    }
+    for key in FRAME_KEYS:
+        arr = buffers[key]
+        trajectory[key] = arr[:nframes] if arr is not None else np.empty((0, *empty_shapes[key]))
+    return trajectory
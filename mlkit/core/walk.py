@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+# 目录扫描结果：按名称排序的 (名称, 是否目录, 子目录扫描 Future 或 None)
+Listing = List[Tuple[str, bool, Optional[Future]]]
+
+
+class _Scanner:
+    def __init__(
+        self,
+        pool: ThreadPoolExecutor,
+        pattern: str,
+        max_depth: Optional[int],
+        ignore: Sequence[str],
+        prune_markers: Sequence[str],
+    ):
+        self.pool = pool
+        self.pattern = pattern
+        self.max_depth = max_depth
+        self.ignore = ignore
+        self.prune_markers = prune_markers
+
+    def _ignored(self, name: str, rel_dir: str) -> bool:
+        rel_path = f"{rel_dir}/{name}" if rel_dir != "." else name
+        return any(fnmatchcase(name, g) or fnmatchcase(rel_path, g) for g in self.ignore)
+
+    def submit(self, directory: str, rel_dir: str, depth: int) -> Future:
+        return self.pool.submit(self.scan, directory, rel_dir, depth)
+
+    def scan(self, directory: str, rel_dir: str, depth: int) -> Listing:
+        """
+        扫描单个目录。在工作线程中立即为子目录提交扫描任务后返回，
+        整棵树因此被并行地提前展开，而消费方仍按排序后的深度优先顺序读取。
+        """
+        try:
+            with os.scandir(directory) as it:
+                entries = [(e.name, e.is_dir(follow_symlinks=False), e.is_file()) for e in it]
+        except OSError:
+            return []
+
+        names = {name for name, _, _ in entries}
+        descend = self.max_depth is None or depth < self.max_depth
+        if any(marker in names for marker in self.prune_markers):
+            descend = False
+
+        listing: Listing = []
+        for name, is_dir, is_file in sorted(entries):
+            if self.ignore and self._ignored(name, rel_dir):
+                continue
+            if is_dir and descend:
+                rel_path = f"{rel_dir}/{name}" if rel_dir != "." else name
+                listing.append((name, True, self.submit(os.path.join(directory, name), rel_path, depth + 1)))
+            elif is_file and fnmatchcase(name, self.pattern):
+                listing.append((name, False, None))
+        return listing
+
+
+def _iter_listing(directory: Path, future: Future) -> Iterator[Path]:
+    for name, is_dir, child in future.result():
+        if is_dir:
+            yield from _iter_listing(directory / name, child)
+        else:
+            yield directory / name
+
+
+def scan_tree(
+    root: Union[Path, str],
+    pattern: str = "*",
+    max_depth: Optional[int] = None,
+    ignore: Sequence[str] = (),
+    prune_markers: Sequence[str] = (),
+    workers: int = 16,
+) -> Iterator[Path]:
+    """
+    用 os.scandir + 线程池并行遍历目录树，流式产出文件名匹配 pattern 的文件。
+
+    - max_depth: 最大递归深度，root 本身为 0
+    - ignore: 忽略的 glob，匹配目录/文件名或相对 root 的路径
+    - prune_markers: 目录中存在这些文件（如 WAVECAR）时，只收集该目录本身的文件，不再深入其子目录
+    - 不跟随目录符号链接；产出顺序为按名称排序的深度优先顺序，与线程数无关
+    """
+    root = Path(root)
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        scanner = _Scanner(pool, pattern, max_depth, ignore, prune_markers)
+        yield from _iter_listing(root, scanner.submit(str(root), ".", 0))
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
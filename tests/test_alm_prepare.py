@@ -0,0 +1,29 @@
+from pathlib import Path
+
+import pytest
+from pymatgen.core import Structure
+
+from mlkit.commands.alm.prepare import gen_alm_input, gen_supercell_poscar
+
+# 参考输出由改写前的逐元素写出版本生成 (2x1x1 NaCl 超胞)
+DATA = Path(__file__).parent / "data" / "alm_prepare"
+
+
+@pytest.fixture
+def supercell() -> Structure:
+    structure = Structure.from_file(DATA / "POSCAR")
+    structure.make_supercell([[2, 0, 0], [0, 1, 0], [0, 0, 1]])
+    return structure
+
+
+def test_sposcar_matches_reference(supercell, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    gen_supercell_poscar(supercell)
+    assert (tmp_path / "SPOSCAR").read_text() == (DATA / "SPOSCAR").read_text()
+
+
+@pytest.mark.parametrize("filename, mode", [("ALM0.in", "suggest"), ("ALM1.in", "optimize")])
+def test_alm_input_matches_reference(supercell, tmp_path, filename, mode):
+    output = tmp_path / filename
+    gen_alm_input(str(output), "nacl", mode, supercell, str_cutoff="*-* None 8 8", norder=3)
+    assert output.read_text() == (DATA / filename).read_text()
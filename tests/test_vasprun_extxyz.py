@@ -0,0 +1,47 @@
+import io
+from pathlib import Path
+
+import pytest
+from ase.io import read, write
+
+from mlkit.core.dataset import DatasetWriter, atoms_to_batch, format_extxyz, frame_batch, load_dataset
+from mlkit.core.vasprun import read_trajectory
+
+# plain.xml 取自 ASE 测试数据 vasprun_pstress.xml；selective.xml 在其 initialpos 中
+# 加入 selective dynamics (原子 1 为 F F F，原子 2 为 T F T)
+DATA = Path(__file__).parent / "data" / "vasprun"
+CASES = ["plain.xml", "selective.xml"]
+
+
+def _ase_extxyz(path: Path) -> str:
+    buf = io.StringIO()
+    write(buf, read(path, index=":", format="vasp-xml"), format="extxyz")
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_fast_reader_matches_ase(name):
+    path = DATA / name
+    assert format_extxyz(read_trajectory(path)) == _ase_extxyz(path)
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_ase_reader_matches_ase(name):
+    path = DATA / name
+    assert format_extxyz(atoms_to_batch(read(path, index=":", format="vasp-xml"))) == _ase_extxyz(path)
+
+
+def test_selective_move_mask():
+    # 与 ASE 一致，只有三个方向都固定的原子记为不可移动
+    assert read_trajectory(DATA / "selective.xml")["move_mask"].tolist() == [False, True]
+    assert read_trajectory(DATA / "plain.xml")["move_mask"].all()
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_columnar_round_trip(name, tmp_path):
+    batch = read_trajectory(DATA / name)
+    with DatasetWriter(tmp_path / "ds") as writer:
+        writer.append(batch)
+    data = load_dataset(tmp_path / "ds")
+    text = "".join(format_extxyz(frame_batch(data, i)) for i in range(len(data["energy"])))
+    assert text == format_extxyz(batch)